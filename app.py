@@ -1,5 +1,5 @@
-import subprocess, threading
-from flask import Flask, jsonify, request, render_template
+import subprocess, threading, json, base64, ast, datetime, zoneinfo, sqlite3, csv, io, time, re, itertools
+from flask import Flask, jsonify, request, render_template, Response, stream_with_context
 import database
 
 app = Flask(__name__)
@@ -17,11 +17,26 @@ def index():
 # DB COLLECTIONS API (Managing the Tables themselves)
 # ----------------------------------------------------
 
+def _not_modified(etag):
+    """A 304 for a conditional GET whose If-None-Match already names this ETag, else None."""
+    if request.if_none_match.contains(etag):
+        return _with_etag(app.response_class(status=304), etag)
+    return None
+
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate; the 304 is cheap
+    return response
+
 @app.route('/api/collections', methods=['GET'])
 def get_collections():
     """Returns all user-created databases (collections)."""
+    etag = database.collections_etag()
+    cached = _not_modified(etag)
+    if cached:
+        return cached
     collections = database.get_collections()
-    return jsonify(collections)
+    return _with_etag(jsonify(collections), etag)
 
 @app.route('/api/collections', methods=['POST'])
 def create_collection():
@@ -45,6 +60,8 @@ def create_collection():
             data.get('parent_item_id')
         )
         return jsonify({'id': coll_id, 'message': 'Collection created successfully'}), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -76,8 +93,12 @@ def add_formula(collection_id):
     if not data or 'name' not in data or 'expression' not in data:
         return jsonify({'error': 'Name and expression are required'}), 400
         
-    success = database.add_formula_to_collection(collection_id, data, data.get('is_summary', False))
+    try:
+        success = database.add_formula_to_collection(collection_id, data, data.get('is_summary', False))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if success:
+        _schedule_materialized_recompute(collection_id)
         return jsonify({'message': 'Formula added successfully'}), 201
     return jsonify({'error': 'Collection not found'}), 404
 
@@ -86,8 +107,12 @@ def update_formula(collection_id, formula_name):
     """Updates an existing formula."""
     data = request.get_json()
     is_summary = request.args.get('is_summary', 'false').lower() == 'true'
-    success = database.update_formula_in_collection(collection_id, formula_name, data, is_summary)
+    try:
+        success = database.update_formula_in_collection(collection_id, formula_name, data, is_summary)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if success:
+        _schedule_materialized_recompute(collection_id)
         return jsonify({'message': 'Formula updated successfully'})
     return jsonify({'error': 'Formula or collection not found'}), 404
 
@@ -97,6 +122,7 @@ def delete_formula(collection_id, formula_name):
     is_summary = request.args.get('is_summary', 'false').lower() == 'true'
     success = database.delete_formula_from_collection(collection_id, formula_name, is_summary)
     if success:
+        _schedule_materialized_recompute(collection_id)
         return jsonify({'message': 'Formula deleted successfully'})
     return jsonify({'error': 'Formula or collection not found'}), 404
 
@@ -111,8 +137,12 @@ def add_field(collection_id):
     if not data or 'name' not in data or 'type' not in data:
         return jsonify({'error': 'Name and type are required'}), 400
     
-    success = database.add_field_to_collection(collection_id, data)
+    try:
+        success = database.add_field_to_collection(collection_id, data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if success:
+        _schedule_materialized_recompute(collection_id)
         return jsonify({'message': 'Field added successfully'}), 201
     return jsonify({'error': 'Failed to add column (safe name might already exist)'}), 400
 
@@ -123,8 +153,12 @@ def update_field(collection_id, field_id):
     if not data or 'name' not in data:
         return jsonify({'error': 'Name is required'}), 400
         
-    success = database.update_field_in_collection(collection_id, field_id, data['name'], data.get('expression'))
+    try:
+        success = database.update_field_in_collection(collection_id, field_id, data['name'], data.get('expression'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     if success:
+        _schedule_materialized_recompute(collection_id)
         return jsonify({'message': 'Field updated'})
     return jsonify({'error': 'Field not found'}), 404
 
@@ -133,267 +167,1201 @@ def delete_field(collection_id, field_id):
     """Drops a column from the collection."""
     success = database.delete_field_from_collection(collection_id, field_id)
     if success:
+        _schedule_materialized_recompute(collection_id)
         return jsonify({'message': 'Field dropped'})
     return jsonify({'error': 'Field not found'}), 404
 
 
+# ----------------------------------------------------
+# INDEXES API (Secondary indexes on a collection's fields)
+# ----------------------------------------------------
+
+@app.route('/api/collections/<collection_id>/indexes', methods=['GET'])
+def list_indexes(collection_id):
+    """Lists the table's indexes with their size and how often queries used them."""
+    indexes = database.list_collection_indexes(collection_id)
+    if indexes is None:
+        return jsonify({'error': 'Collection not found'}), 404
+    return jsonify(indexes)
+
+@app.route('/api/collections/<collection_id>/indexes', methods=['POST'])
+def create_index(collection_id):
+    """Creates an index on one field or, in the given order, several: {"fields": [...], "unique": false, "name": optional}."""
+    data = request.get_json()
+    fields = data.get('fields') if data else None
+    if isinstance(fields, str):
+        fields = [fields]
+    if not fields or not isinstance(fields, list):
+        return jsonify({'error': 'fields is required'}), 400
+    try:
+        index = database.create_collection_index(collection_id, fields, data.get('unique', False), data.get('name'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if index is None:
+        return jsonify({'error': 'Collection not found'}), 404
+    return jsonify(index), 201
+
+@app.route('/api/collections/<collection_id>/indexes/<index_name>', methods=['DELETE'])
+def drop_index(collection_id, index_name):
+    """Drops a user-created index."""
+    if database.drop_collection_index(collection_id, index_name):
+        return jsonify({'message': 'Index dropped'})
+    return jsonify({'error': 'Index or collection not found'}), 404
+
 # ----------------------------------------------------
 # ITEMS API (Managing the Rows inside a Table)
 # ----------------------------------------------------
 
 def _get_table_metadata(collection_id):
-    """Helper to fetch the physical table_name and schema for a collection."""
-    conn = database.get_db_connection()
-    coll = conn.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    conn.close()
-    
-    if not coll:
+    """Helper to fetch the physical table_name and schema for a collection (served from the metadata cache)."""
+    meta = database.get_collection_metadata(collection_id)
+    if not meta:
         return None, None
-        
-    import json
-    return coll['table_name'], json.loads(coll['schema_json'])
+    return meta['table_name'], meta['schema']
 
-@app.route('/api/collections/<collection_id>/items', methods=['GET'])
-def get_items(collection_id):
-    """Returns all items inside a specific collection, computing formulas dynamically."""
-    table_name, schema = _get_table_metadata(collection_id)
-    if not table_name:
-        return jsonify({'error': 'Collection not found'}), 404
-        
-    conn = database.get_db_connection()
-    try:
-        items = conn.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC').fetchall()
-        items_list = [dict(ix) for ix in items]
+_normalize = database.normalize_field_name
+_build_lookup = database.build_field_lookup
+
+class SmartRow(dict):
+    def __init__(self, data, schema_fields, all_rows=None, lookup=None, loader=None):
+        super().__init__(data)
+        self._fields = schema_fields
+        self._all_rows = all_rows
+        self._loader = loader
+        self._evaluating = set() # For cycle detection
         
-        display_map = {f.get('name'): f.get('safe_name') for f in schema.get('fields', [])}
-        display_map_lower = {k.lower(): v for k, v in display_map.items()}
+        # Maps for robust lookups (shared between rows when built by a RowList)
+        self._d_map, self._d_map_norm, self._type_map = lookup or _build_lookup(schema_fields)
+
+        # Materialized formulas arrive in their shadow column; expose them under the field name
+        for f in schema_fields:
+            column = f.get('materialized_column')
+            if column and column in self:
+                raw = dict.pop(self, column)
+                if raw is not None:
+                    self[f.get('safe_name')] = json.loads(raw)
+
+    def _resolve_key(self, name):
+        if name in self._d_map: return self._d_map[name]
+        norm = _normalize(name)
+        return self._d_map_norm.get(norm, name)
+
+    def __getattr__(self, name):
+        return self[name]
+
+    def __getitem__(self, key):
+        safe_key = self._resolve_key(key)
+        val = dict.get(self, safe_key)
+        field_meta = self._type_map.get(safe_key)
         
-        def to_camel_case(s):
-            import re
-            s = re.sub(r'[^a-zA-Z0-9 ]', ' ', s).strip()
-            parts = s.split()
-            if not parts: return s
-            return parts[0].lower() + ''.join(p.capitalize() for p in parts[1:])
-
-        def _normalize(s):
-            import re
-            return re.sub(r'[^a-zA-Z0-9]', '', s).lower()
-
-        class SmartRow(dict):
-            def __init__(self, data, schema_fields, all_rows=None):
-                super().__init__(data)
-                self._fields = schema_fields
-                self._all_rows = all_rows
-                self._evaluating = set() # For cycle detection
-                
-                # Maps for robust lookups
-                self._d_map = {f.get('name'): f.get('safe_name') for f in schema_fields}
-                self._d_map_norm = {_normalize(f.get('name')): f.get('safe_name') for f in schema_fields}
-                self._type_map = {f.get('safe_name'): f for f in schema_fields}
-
-            def _resolve_key(self, name):
-                if name in self._d_map: return self._d_map[name]
-                norm = _normalize(name)
-                return self._d_map_norm.get(norm, name)
-
-            def __getattr__(self, name):
-                return self[name]
-
-            def __getitem__(self, key):
-                safe_key = self._resolve_key(key)
-                val = dict.get(self, safe_key)
-                field_meta = self._type_map.get(safe_key)
-                
-                if field_meta:
-                    if field_meta.get('type') == 'Formula' and val is None:
-                        if safe_key in self._evaluating:
-                            return "Err: Circular reference"
-                        self._evaluating.add(safe_key)
-                        try:
-                            expr = field_meta.get('expression', '')
-                            if expr:
-                                env = {
-                                    "row": self,
-                                    "rows": self._all_rows or RowList([], []),
-                                    "sum": sum, "len": len, "max": max, "min": min, "round": round,
-                                    "__builtins__": {}
-                                }
-                                val = eval(expr, {"__builtins__": {}}, env)
-                                self[safe_key] = val
-                            else:
-                                val = ""
-                        except Exception as e:
-                            val = f"Err: {e}"
-                        finally:
-                            self._evaluating.remove(safe_key)
-
-                    if field_meta.get('type') == 'Number' and val is None:
-                        return 0
-                    if field_meta.get('type') == 'NestedDatabase' and val:
-                        return NestedProxy(val)
-                    if field_meta.get('type') == 'Relation':
-                        return RelationProxy(field_meta.get('target_collection_id'), val)
-                return val
-
-        class RowList(list):
-            def __init__(self, items, schema_fields=None, summary_formulas=None):
-                if schema_fields:
-                    items = [SmartRow(i, schema_fields) if not isinstance(i, SmartRow) else i for i in items]
-                super().__init__(items)
-                self._fields = schema_fields or []
-                self._summaries = summary_formulas or []
-                if schema_fields:
-                    for item in self:
-                        item._all_rows = self
-                        
-                # Maps for robust lookups
-                self._d_map = {f.get('name'): f.get('safe_name') for f in self._fields}
-                self._d_map_norm = {_normalize(f.get('name')): f.get('safe_name') for f in self._fields}
-                
-                self._s_map = {s.get('name'): s.get('expression') for s in self._summaries}
-                self._s_map_norm = {_normalize(s.get('name')): s.get('expression') for s in self._summaries}
-
-            def sort(self, by, ascending=True):
-                safe_by = self._resolve_attr_to_key(by)
-                def safe_sort_key(x):
-                    val = x[safe_by] if safe_by else x.get(by)
-                    if val is None:
-                        return (0, "")
-                    if isinstance(val, (int, float)):
-                        return (1, val)
-                    return (2, str(val))
-                return RowList(sorted(self, key=safe_sort_key, reverse=not ascending), self._fields, self._summaries)
-
-            def filter(self, condition):
-                return RowList([x for x in self if condition(x)], self._fields, self._summaries)
-
-            def _resolve_attr_to_key(self, name):
-                if name in self._d_map: return self._d_map[name]
-                norm = _normalize(name)
-                return self._d_map_norm.get(norm)
-
-            def index(self, value):
-                for i, item in enumerate(self):
-                    if item == value:
-                        return i
-                return -1
-                
-            def __getattr__(self, name):
-                # 1. Check columns
-                target_key = self._resolve_attr_to_key(name)
-                if target_key:
-                    return [x[target_key] for x in self]
-                
-                # 2. Check summary formulas
-                norm = _normalize(name)
-                expr = self._s_map.get(name)
-                if not expr:
-                    expr = self._s_map_norm.get(norm)
-                
-                if expr:
-                    try:
-                        env = {
-                            "rows": self,
-                            "sum": sum, "len": len, "max": max, "min": min, "round": round,
-                            "__builtins__": {}
-                        }
-                        return eval(expr, {"__builtins__": {}}, env)
-                    except Exception as e:
-                        return f"Err: {e}"
-                
-                raise AttributeError(f"'RowList' object has no attribute '{name}'")
-
-        class NestedProxy(RowList):
-            def __init__(self, nested_id):
-                t_name, t_schema = _get_table_metadata(nested_id)
-                if not t_name:
-                    super().__init__([])
-                    return
-                
-                inner_conn = database.get_db_connection()
+        if field_meta:
+            if field_meta.get('type') == 'Formula' and val is None:
+                if safe_key in self._evaluating:
+                    return "Err: Circular reference"
+                self._evaluating.add(safe_key)
                 try:
-                    inner_items = inner_conn.execute(f'SELECT * FROM {t_name}').fetchall()
-                    inner_items_list = [dict(ix) for ix in inner_items]
+                    expr = field_meta.get('expression', '')
+                    if expr:
+                        env = _formula_env(row=self, rows=self._all_rows or RowList([], []))
+                        val = eval(database.compile_formula(expr), env)
+                        if isinstance(val, NestedProxy):
+                            val._ensure_loaded()
+                        self[safe_key] = val
+                    else:
+                        val = ""
+                except Exception as e:
+                    val = f"Err: {e}"
                 finally:
-                    inner_conn.close()
-                
-                super().__init__(inner_items_list, t_schema.get('fields', []), t_schema.get('summary_formulas', []))
-
-        class RelationProxy:
-            def __init__(self, target_collection_id, target_item_id):
-                self.target_collection_id = target_collection_id
-                self.target_item_id = target_item_id
-                self._smart_row = None
-
-            def _ensure_loaded(self):
-                if self._smart_row is not None:
-                    return
-                t_name, t_schema = _get_table_metadata(self.target_collection_id)
-                if not t_name:
-                    self._smart_row = SmartRow({}, [])
-                    return
+                    self._evaluating.remove(safe_key)
+
+            if field_meta.get('type') == 'Number' and val is None:
+                return 0
+            if field_meta.get('type') == 'NestedDatabase' and val:
+                return self._loader.get_nested(val) if self._loader else NestedProxy(val)
+            if field_meta.get('type') == 'Relation':
+                return RelationProxy(field_meta.get('target_collection_id'), val, self._loader)
+        return val
+
+class RowList(list):
+    def __init__(self, items, schema_fields=None, summary_formulas=None, loader=None):
+        self._fields = schema_fields or []
+        self._summaries = summary_formulas or []
+        lookup = _build_lookup(self._fields)
+        if schema_fields:
+            items = [SmartRow(i, schema_fields, lookup=lookup, loader=loader) if not isinstance(i, SmartRow) else i for i in items]
+        super().__init__(items)
+        if schema_fields:
+            for item in self:
+                item._all_rows = self
                 
-                if self.target_item_id is None:
-                    # Return an empty SmartRow with the correct schema to allow safe property access (e.g. .Calories -> 0)
-                    self._smart_row = SmartRow({}, t_schema.get('fields', []))
-                    return
+        # Maps for robust lookups
+        self._d_map, self._d_map_norm, _ = lookup
+        
+        self._s_map = {s.get('name'): s.get('expression') for s in self._summaries}
+        self._s_map_norm = {_normalize(s.get('name')): s.get('expression') for s in self._summaries}
+
+    def sort(self, by, ascending=True):
+        safe_by = self._resolve_attr_to_key(by)
+        def safe_sort_key(x):
+            val = x[safe_by] if safe_by else x.get(by)
+            if val is None:
+                return (0, "")
+            if isinstance(val, (int, float)):
+                return (1, val)
+            return (2, str(val))
+        return RowList(sorted(self, key=safe_sort_key, reverse=not ascending), self._fields, self._summaries)
+
+    def filter(self, condition):
+        return RowList([x for x in self if condition(x)], self._fields, self._summaries)
+
+    def _resolve_attr_to_key(self, name):
+        if name in self._d_map: return self._d_map[name]
+        norm = _normalize(name)
+        return self._d_map_norm.get(norm)
+
+    def index(self, value):
+        for i, item in enumerate(self):
+            if item == value:
+                return i
+        return -1
+        
+    def __getattr__(self, name):
+        # 1. Check columns
+        target_key = self._resolve_attr_to_key(name)
+        if target_key:
+            return [x[target_key] for x in self]
+        
+        # 2. Check summary formulas
+        norm = _normalize(name)
+        expr = self._s_map.get(name)
+        if not expr:
+            expr = self._s_map_norm.get(norm)
+        
+        if expr:
+            try:
+                return eval(database.compile_formula(expr), _formula_env(rows=self))
+            except Exception as e:
+                return f"Err: {e}"
+        
+        raise AttributeError(f"'RowList' object has no attribute '{name}'")
+
+class NestedProxy(RowList):
+    """
+    Rows of a nested database. Rows are only fetched when the list is actually used, so
+    aggregates like sum(row.Tasks.Hours) or len(row.Tasks) can be answered in SQL instead.
+    """
+    def __init__(self, nested_id, loader=None, meta=None):
+        self._nested_id = nested_id
+        self._loader = loader
+        self._meta = meta if meta is not None else database.get_collection_metadata(nested_id)
+        self._aggregates = {}
+        if not self._meta:
+            self._loaded = True
+            super().__init__([])
+            return
+        # Marked loaded while RowList initializes so its bookkeeping loop doesn't trigger a fetch
+        self._loaded = True
+        t_schema = self._meta['schema']
+        super().__init__([], t_schema.get('fields', []), t_schema.get('summary_formulas', []), loader)
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        t_fields = self._meta['schema'].get('fields', [])
+        
+        inner_conn = database.get_db_connection()
+        try:
+            inner_items = inner_conn.execute(f"SELECT * FROM {self._meta['table_name']}").fetchall()
+        finally:
+            inner_conn.close()
+        
+        inner_rows = [SmartRow(dict(ix), t_fields, all_rows=self, lookup=self._meta['lookup'], loader=self._loader) for ix in inner_items]
+        list.extend(self, inner_rows)
+        if self._loader:
+            self._loader.queue_rows(self, t_fields)
+
+    def __iter__(self):
+        self._ensure_loaded()
+        return super().__iter__()
+
+    def __reversed__(self):
+        self._ensure_loaded()
+        return super().__reversed__()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return super().__len__()
+
+    def __getitem__(self, index):
+        self._ensure_loaded()
+        return super().__getitem__(index)
+
+    def __contains__(self, value):
+        self._ensure_loaded()
+        return super().__contains__(value)
+
+    def __repr__(self):
+        self._ensure_loaded()
+        return super().__repr__()
+
+    def aggregate(self, fn, attr=None):
+        """
+        Computes fn ('len', 'sum', 'min' or 'max') over a Number column of the child table in SQL.
+        Returns _NOT_PUSHED_DOWN when the rows are already in memory, the column is not a stored
+        Number, or it holds text (which the Python evaluator reports as an error).
+        """
+        if self._loaded:
+            return _NOT_PUSHED_DOWN
+        t_name = self._meta['table_name']
+        if fn == 'len':
+            col = None
+        else:
+            col = self._resolve_attr_to_key(attr)
+            field = self._meta['lookup'][2].get(col)
+            if not field or field.get('type') != 'Number':
+                return _NOT_PUSHED_DOWN
+
+        cache_key = (fn, col)
+        if cache_key not in self._aggregates:
+            conn = database.get_db_connection()
+            try:
+                if col is None:
+                    count, value, non_numeric = conn.execute(f"SELECT COUNT(*), NULL, 0 FROM {t_name}").fetchone()
+                else:
+                    # Unset numbers read as 0 through SmartRow, so they count as 0 here too
+                    sql_fn = {'sum': 'SUM', 'min': 'MIN', 'max': 'MAX'}[fn]
+                    count, value, non_numeric = conn.execute(
+                        f"SELECT COUNT(*), {sql_fn}(COALESCE({col}, 0)), SUM(typeof({col}) IN ('text', 'blob')) FROM {t_name}"
+                    ).fetchone()
+            finally:
+                conn.close()
+            self._aggregates[cache_key] = (count, value, non_numeric)
+
+        count, value, non_numeric = self._aggregates[cache_key]
+        if non_numeric:
+            return _NOT_PUSHED_DOWN
+        if fn == 'len':
+            return count
+        if count == 0:
+            if fn == 'sum':
+                return 0
+            raise ValueError(f"{fn}() arg is an empty sequence")
+        return value
+
+_NOT_PUSHED_DOWN = object()
+_AGGREGATE_FUNCTIONS = {'sum': sum, 'len': len, 'min': min, 'max': max}
+
+def _aggregate(fn, target, attr=None):
+    """
+    Target of the formula compiler's rewrite of sum/min/max(X.col) and len(X). Nested
+    databases answer in SQL when they can; everything else evaluates exactly as written.
+    """
+    if isinstance(target, NestedProxy):
+        value = target.aggregate(fn, attr)
+        if value is not _NOT_PUSHED_DOWN:
+            return value
+    values = target if attr is None else getattr(target, attr)
+    return _AGGREGATE_FUNCTIONS[fn](values)
+
+_FORMULA_BUILTINS = {"sum": sum, "len": len, "max": max, "min": min, "round": round, "_aggregate": _aggregate}
+
+def _formula_env(**names):
+    """Namespace formulas are evaluated in. Used as globals so lambdas and comprehensions see row/rows too."""
+    env = dict(_FORMULA_BUILTINS)
+    env.update(names)
+    env["__builtins__"] = {}
+    return env
+
+def _relation_key(item_id):
+    # Relation columns may hold the target id as INTEGER or TEXT depending on how the field was created
+    try:
+        return int(item_id)
+    except (TypeError, ValueError):
+        return item_id
+
+class RelationLoader:
+    """
+    Per-request loader for Relation targets and nested databases. Rows queue the ids they
+    reference, and the first access to a target collection fetches every queued id with one
+    IN (...) query. Each target item is wrapped once, so all proxies pointing at it share one
+    SmartRow, and each nested database is represented by a single NestedProxy per request.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._loaded = {}   # target_collection_id -> {item_id: SmartRow}
+        self._pending = {}  # target_collection_id -> set of item_ids not fetched yet
+        self._empty = {}    # target_collection_id -> SmartRow used for unset relations
+        self._meta = {}     # target_collection_id -> metadata, resolved once per request
+        self._nested = {}   # nested collection id -> NestedProxy shared by every row and formula
+
+    def queue(self, target_collection_id, item_id):
+        if not target_collection_id or item_id is None or item_id == '':
+            return
+        key = _relation_key(item_id)
+        if key not in self._loaded.get(target_collection_id, {}):
+            self._pending.setdefault(target_collection_id, set()).add(key)
+
+    def queue_rows(self, rows, schema_fields):
+        """Queues the relation targets referenced by every row so they load in one batch."""
+        for f in schema_fields:
+            if f.get('type') == 'Relation':
+                for row in rows:
+                    self.queue(f.get('target_collection_id'), dict.get(row, f.get('safe_name')))
+
+    def _get_meta(self, target_collection_id):
+        if target_collection_id not in self._meta:
+            self._meta[target_collection_id] = database.get_collection_metadata(target_collection_id)
+        return self._meta[target_collection_id]
+
+    def get_nested(self, nested_id):
+        if nested_id not in self._nested:
+            self._nested[nested_id] = NestedProxy(nested_id, self, self._get_meta(nested_id))
+        return self._nested[nested_id]
+
+    def get(self, target_collection_id, item_id):
+        meta = self._get_meta(target_collection_id)
+        if not meta:
+            return SmartRow({}, [])
+        fields = meta['schema'].get('fields', [])
+
+        if item_id is None or item_id == '':
+            # An empty SmartRow with the correct schema allows safe property access (e.g. .Calories -> 0)
+            if target_collection_id not in self._empty:
+                self._empty[target_collection_id] = SmartRow({}, fields, lookup=meta['lookup'], loader=self)
+            return self._empty[target_collection_id]
+
+        key = _relation_key(item_id)
+        loaded = self._loaded.setdefault(target_collection_id, {})
+        if key not in loaded:
+            self._pending.setdefault(target_collection_id, set()).add(key)
+            self._load_pending(target_collection_id, meta)
+        return loaded[key]
+
+    def _load_pending(self, target_collection_id, meta):
+        loaded = self._loaded[target_collection_id]
+        ids = [i for i in self._pending.pop(target_collection_id, ()) if i not in loaded]
+        fields = meta['schema'].get('fields', [])
+        new_rows = []
+
+        conn = database.get_db_connection()
+        try:
+            for start in range(0, len(ids), self.BATCH_SIZE):
+                chunk = ids[start:start + self.BATCH_SIZE]
+                placeholders = ', '.join('?' for _ in chunk)
+                res = conn.execute(f"SELECT * FROM {meta['table_name']} WHERE id IN ({placeholders})", chunk).fetchall()
+                for r in res:
+                    row = SmartRow(dict(r), fields, lookup=meta['lookup'], loader=self)
+                    loaded[_relation_key(r['id'])] = row
+                    new_rows.append(row)
+        finally:
+            conn.close()
+
+        for i in ids:
+            if i not in loaded:
+                loaded[i] = SmartRow({}, fields, lookup=meta['lookup'], loader=self)
+        # Queue the next hop so chains like row.Meal.Food.Calories also load per batch
+        self.queue_rows(new_rows, fields)
 
-                conn = database.get_db_connection()
+class RelationProxy:
+    def __init__(self, target_collection_id, target_item_id, loader=None):
+        self.target_collection_id = target_collection_id
+        self.target_item_id = target_item_id
+        self._loader = loader
+        self._smart_row = None
+
+    def _ensure_loaded(self):
+        if self._smart_row is not None:
+            return
+        loader = self._loader or RelationLoader()
+        self._smart_row = loader.get(self.target_collection_id, self.target_item_id)
+
+    def __getattr__(self, name):
+        self._ensure_loaded()
+        return getattr(self._smart_row, name)
+
+    def __getitem__(self, key):
+        self._ensure_loaded()
+        return self._smart_row[key]
+
+    def __repr__(self):
+        return f"<RelationProxy {self.target_collection_id}:{self.target_item_id}>"
+
+# Keyset pagination: pages are ordered by (created_at DESC, id DESC)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def _encode_cursor(row):
+    """Packs the (created_at, id) sort key of a row into an opaque cursor string."""
+    raw = json.dumps([row['created_at'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_cursor(cursor):
+    """Inverse of _encode_cursor. Raises ValueError on malformed input."""
+    try:
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return created_at, int(item_id)
+
+def _parse_page_args(args, decode_cursor=_decode_cursor):
+    """Returns (limit, after) if the request asks for a page, else None."""
+    if 'limit' not in args and 'after' not in args:
+        return None
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(args['after']) if args.get('after') else None
+    return limit, after
+
+# --- Summary pushdown ---
+# Common summary shapes over stored columns are answered from the incrementally
+# maintained aggregate state (database.read_summary_aggregates) instead of wrapping
+# every row: len(rows), sum/min/max(rows.<Number field>), and round(...) around any
+# of those, as long as the column holds only numbers. Everything else goes through
+# the Python evaluator.
+
+_SUMMARY_AGGREGATES = ('sum', 'min', 'max')
+
+def _plan_summary_node(node, lookup):
+    if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name) or node.keywords:
+        return None
+    fn, args = node.func.id, node.args
+    if fn == 'round' and len(args) in (1, 2):
+        inner = _plan_summary_node(args[0], lookup)
+        if inner is None:
+            return None
+        if len(args) == 1:
+            return ('round', inner)
+        if isinstance(args[1], ast.Constant) and type(args[1].value) is int:
+            return ('round', inner, args[1].value)
+        return None
+    if len(args) != 1:
+        return None
+    arg = args[0]
+    if fn == 'len' and isinstance(arg, ast.Name) and arg.id == 'rows':
+        return ('agg', 'len', None)
+    if fn in _SUMMARY_AGGREGATES and isinstance(arg, ast.Attribute) and isinstance(arg.value, ast.Name) and arg.value.id == 'rows':
+        d_map, d_map_norm, type_map = lookup
+        col = d_map.get(arg.attr) or d_map_norm.get(_normalize(arg.attr))
+        field = type_map.get(col)
+        if field and field.get('type') == 'Number':
+            return ('agg', fn, col)
+    return None
+
+def _plan_summary(expression, lookup):
+    """Returns a pushdown plan for a summary expression, or None if it must run in Python."""
+    if not expression:
+        return None
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        return None
+    return _plan_summary_node(tree.body, lookup)
+
+def _plan_aggregates(plan, out):
+    if plan[0] == 'round':
+        _plan_aggregates(plan[1], out)
+    elif plan[1] != 'len' and (plan[1], plan[2]) not in out:
+        out.append((plan[1], plan[2]))
+
+def _apply_summary_plan(plan, count, values):
+    if plan[0] == 'round':
+        return round(_apply_summary_plan(plan[1], count, values), *plan[2:])
+    fn, col = plan[1], plan[2]
+    if fn == 'len':
+        return count
+    if count == 0:
+        # Mirror the Python evaluator on an empty collection
+        if fn == 'sum':
+            return 0
+        raise ValueError(f"{fn}() arg is an empty sequence")
+    return values[(fn, col)]
+
+def _pushdown_summaries(conn, collection_id, table_name, summary_defs, lookup):
+    """
+    Evaluates every pushable summary from the collection's aggregate state.
+    Returns ({summary index: value}, plan report); indexes missing from the dict need Python.
+    """
+    plans = [_plan_summary(sdf.get('expression', ''), lookup) for sdf in summary_defs]
+    aggregates = []
+    for plan in plans:
+        if plan:
+            _plan_aggregates(plan, aggregates)
+
+    pushed, source = {}, None
+    if any(plans):
+        try:
+            columns = sorted({col for _, col in aggregates})
+            count, state, scanned = database.read_summary_aggregates(conn, collection_id, table_name, columns)
+        except Exception as e:
+            print(f"Summary pushdown failed for {table_name}, falling back to Python: {e}")
+            plans = [None] * len(plans)
+        else:
+            source = 'table_scan' if scanned else 'aggregate_state'
+            values = {(fn, col): state[col][fn] for fn, col in aggregates}
+            for i, plan in enumerate(plans):
+                if not plan:
+                    continue
+                used = []
+                _plan_aggregates(plan, used)
+                if any(state[col]['non_numeric'] for _, col in used):
+                    # Text in a Number column: the Python evaluator reports the error SQL would hide
+                    plans[i] = None
+                    continue
                 try:
-                    res = conn.execute(f'SELECT * FROM {t_name} WHERE id = ?', (self.target_item_id,)).fetchone()
-                    data = dict(res) if res else {}
-                    self._smart_row = SmartRow(data, t_schema.get('fields', []))
-                finally:
-                    conn.close()
+                    pushed[i] = _apply_summary_plan(plan, count, values)
+                except Exception as eval_err:
+                    pushed[i] = f"Err: {eval_err}"
+
+    report = [{
+        'name': sdf.get('name', 'Summary'),
+        'plan': 'sql' if plans[i] else 'python',
+        'source': source if plans[i] else None
+    } for i, sdf in enumerate(summary_defs)]
+    return pushed, report
+
+def _evaluate_summaries(schema, wrapped_rows, pushed=None):
+    """Evaluates the collection's summary formulas over a RowList, using pushed-down values where available."""
+    pushed = pushed or {}
+    summaries = []
+    for i, sdf in enumerate(schema.get('summary_formulas', [])):
+        expr = sdf.get('expression', '')
+        val = None
+        if i in pushed:
+            val = pushed[i]
+        elif expr:
+            try:
+                val = eval(database.compile_formula(expr), _formula_env(rows=wrapped_rows))
+            except Exception as eval_err:
+                val = f"Err: {eval_err}"
+        summaries.append({
+            'name': sdf.get('name', 'Summary'),
+            'value': val,
+            'expression': expr
+        })
+    return summaries
+
+# --- Materialized formulas ---
+# Formula fields flagged 'materialized' are stored in a shadow column (see database.py).
+# Writes recompute just the touched rows; schema edits clear the stored values and
+# refresh the whole collection in a background thread. Formulas that read `rows`
+# depend on every row, so any write to such a collection triggers the full refresh.
+# Only formulas that depend on their own row can be materialized: nothing refreshes a
+# stored value when a related or nested row changes, so formulas reading through
+# Relation or NestedDatabase fields are rejected (database.materialized_dependency_error).
+
+MATERIALIZE_CHUNK_SIZE = 1000
+
+_recompute_lock = threading.Lock()
+_recompute_running = set()
+_recompute_dirty = set()
+
+def _formulas_read_all_rows(schema):
+    return any(database.formula_reads_rows(f.get('expression')) for f in schema.get('fields', []) if f.get('type') == 'Formula')
+
+def _encode_materialized(val):
+    try:
+        return json.dumps(val)
+    except (TypeError, ValueError):
+        return None # Not storable (e.g. a Relation proxy); stays computed on read
+
+def _recompute_materialized(collection_id, item_ids=None):
+    """
+    Recomputes and stores materialized formulas for the given items (all items if None).
+    Reading, evaluating and writing happen in one IMMEDIATE transaction so a concurrent
+    write to the same rows cannot be overwritten with a value computed before it.
+    """
+    meta = database.get_collection_metadata(collection_id)
+    if not meta:
+        return 0
+    schema, table_name = meta['schema'], meta['table_name']
+    mat_fields = database.materialized_fields(schema)
+    if not mat_fields:
+        return 0
+    fields = schema.get('fields', [])
+    shadow = {f['materialized_column'] for f in mat_fields}
+
+    conn = database.get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if item_ids is None or _formulas_read_all_rows(schema):
+            items = conn.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC, id DESC').fetchall()
+        else:
+            placeholders = ', '.join('?' for _ in item_ids)
+            items = conn.execute(f'SELECT * FROM {table_name} WHERE id IN ({placeholders})', list(item_ids)).fetchall()
+
+        loader = RelationLoader()
+        # Shadow values are dropped so every formula is evaluated fresh
+        rows = RowList([{k: v for k, v in dict(ix).items() if k not in shadow} for ix in items], fields, schema.get('summary_formulas', []), loader)
+        targets = rows if item_ids is None else [r for r in rows if r['id'] in set(item_ids)]
+        loader.queue_rows(targets, fields)
+
+        updates = []
+        for row in targets:
+            values = []
+            for f in mat_fields:
+                _ = row[f['name']]
+                val = dict.get(row, f['safe_name'])
+                values.append(_encode_materialized(val) if val is not None else None)
+            updates.append(values + [row['id']])
+
+        set_clause = ', '.join(f"{f['materialized_column']} = ?" for f in mat_fields)
+        conn.executemany(f'UPDATE {table_name} SET {set_clause} WHERE id = ?', updates)
+        conn.commit()
+        return len(updates)
+    finally:
+        conn.close()
+
+def _recompute_all_materialized(collection_id):
+    meta = database.get_collection_metadata(collection_id)
+    if not meta or not database.materialized_fields(meta['schema']):
+        return
+    if _formulas_read_all_rows(meta['schema']):
+        _recompute_materialized(collection_id)
+        return
+    # Row-local formulas can be refreshed in chunks so writers are never blocked for long
+    conn = database.get_db_connection()
+    try:
+        ids = [r['id'] for r in conn.execute(f"SELECT id FROM {meta['table_name']}").fetchall()]
+    finally:
+        conn.close()
+    for start in range(0, len(ids), MATERIALIZE_CHUNK_SIZE):
+        _recompute_materialized(collection_id, ids[start:start + MATERIALIZE_CHUNK_SIZE])
+
+def _run_materialized_recompute(collection_id):
+    while True:
+        try:
+            _recompute_all_materialized(collection_id)
+        except Exception as e:
+            print(f"Materialized recompute failed for {collection_id}: {e}")
+        with _recompute_lock:
+            if collection_id in _recompute_dirty:
+                # Another edit landed while we were running; go again
+                _recompute_dirty.discard(collection_id)
+                continue
+            _recompute_running.discard(collection_id)
+            return
+
+def _schedule_materialized_recompute(collection_id):
+    """Starts a background full recompute if the collection has materialized formulas."""
+    meta = database.get_collection_metadata(collection_id)
+    if not meta or not database.materialized_fields(meta['schema']):
+        return
+    with _recompute_lock:
+        if collection_id in _recompute_running:
+            _recompute_dirty.add(collection_id)
+            return
+        _recompute_running.add(collection_id)
+    threading.Thread(target=_run_materialized_recompute, args=(collection_id,), daemon=True).start()
+
+def _refresh_materialized_after_write(collection_id, item_ids):
+    """Keeps materialized formulas current after items were added, updated or deleted."""
+    meta = database.get_collection_metadata(collection_id)
+    if not meta or not database.materialized_fields(meta['schema']):
+        return
+    if _formulas_read_all_rows(meta['schema']):
+        database.reset_materialized(collection_id)
+        _schedule_materialized_recompute(collection_id)
+    elif item_ids:
+        try:
+            _recompute_materialized(collection_id, item_ids)
+        except Exception as e:
+            # The value is simply computed on read until the next refresh
+            print(f"Materialized refresh failed for {collection_id}: {e}")
+
+@app.route('/api/collections/<collection_id>/materialized/refresh', methods=['POST'])
+def refresh_materialized(collection_id):
+    """Recomputes every materialized formula of a collection in the background."""
+    if not database.get_collection_metadata(collection_id):
+        return jsonify({'error': 'Collection not found'}), 404
+    _schedule_materialized_recompute(collection_id)
+    return jsonify({'message': 'Materialized formula refresh scheduled'}), 202
+
+# --- Item queries ---
+# ?where= takes a formula-style boolean expression over fields, e.g.
+#   Hours > 3 and Status == "Done" and row['Due Date'] >= "2024-01-01" and Tag in ["a", "b"]
+# Top-level `and` terms comparing a stored column with constants compile to parameterized
+# SQL; terms involving formulas (or anything else) are evaluated in Python, but only on the
+# rows SQL already matched. ?order_by=Field,-Other sorts in SQL unless a key is a formula
+# field, and ?fields=a,b trims each item to id plus those fields. Compiled terms select
+# the same rows the Python evaluator would (an unset Number reads as 0, `not` keeps unset
+# rows, ordering an unset value fails the expression), with two deliberate differences:
+# an unset Text equals both None and "", and a Relation compares by the related item's id.
+# Unset values sort first (last when descending). Summaries still cover every row.
+
+QUERY_BUILTIN_COLUMNS = {'id': 'Builtin', 'created_at': 'Builtin'}
+
+_SQL_COMPARISONS = {ast.Eq: '=', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+_FLIPPED_COMPARISONS = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE}
+_PY_COMPARISONS = {ast.Eq: lambda a, b: a == b, ast.NotEq: lambda a, b: a != b,
+                   ast.Lt: lambda a, b: a < b, ast.LtE: lambda a, b: a <= b,
+                   ast.Gt: lambda a, b: a > b, ast.GtE: lambda a, b: a >= b}
+
+def _resolve_query_field(name, lookup):
+    """Returns (safe_name, type) for a display name, loose name or safe_name, or None."""
+    d_map, d_map_norm, type_map = lookup
+    if name in QUERY_BUILTIN_COLUMNS or name in BUILTIN_ITEM_COLUMNS:
+        return name, 'Builtin'
+    safe = d_map.get(name) or d_map_norm.get(_normalize(name)) or (name if name in type_map else None)
+    if safe is None:
+        return None
+    return safe, type_map[safe].get('type')
+
+def _query_field_ref(node, lookup):
+    """Resolves Name, row.Name and row['Name'] nodes to (safe_name, type); None for anything else."""
+    if isinstance(node, ast.Name):
+        name = node.id
+    elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'row':
+        name = node.attr
+    elif (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == 'row'
+          and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+        name = node.slice.value
+    else:
+        return None
+    return _resolve_query_field(name, lookup)
+
+def _query_constant(node):
+    """Literal value of a constant, negated number or list/tuple of constants. Raises ValueError otherwise."""
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_query_constant(elt) for elt in node.elts]
+    value = ast.literal_eval(node)
+    if not isinstance(value, (str, int, float, type(None))):
+        raise ValueError('not a constant')
+    return value
+
+def _coerce_query_value(column, ftype, value):
+    if value is None:
+        return None
+    if column == 'id':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"id: '{value}' is not an item id")
+    if ftype == 'Builtin' and column != 'is_all_day':
+        return str(value)
+    if isinstance(value, bool) and ftype != 'Builtin':
+        value = int(value)
+    return _coerce_import_value(column, ftype, value)
+
+def _unset_sql(column, ftype):
+    """SQL that is true for an unset value; Text treats NULL and '' alike (see above)."""
+    return f"({column} IS NULL OR {column} = '')" if ftype == 'Text' else f"{column} IS NULL"
+
+def _compile_comparison(column, ftype, op, value, params, conjunctive=True):
+    """
+    SQL for `column op value`, or None when the comparison needs Python semantics.
+    conjunctive says whether the comparison only sits under `and`. Elsewhere the SQL is
+    never NULL, so `not` and `or` combine it like Python. Ordering an unset non-Number
+    raises in Python, which fails the whole expression, so it only compiles under `and`.
+    """
+    if isinstance(op, (ast.In, ast.NotIn)):
+        if not isinstance(value, list):
+            return None
+        values = [_coerce_query_value(column, ftype, v) for v in value]
+        present = [v for v in values if v is not None]
+        clauses = []
+        if present:
+            clauses.append(f"{column} IN ({', '.join('?' * len(present))})")
+            params.extend(present)
+        # An unset Number reads as 0; anything else only matches a None entry
+        if (0 in present) if ftype == 'Number' else (len(present) < len(values)):
+            clauses.append(_unset_sql(column, ftype))
+        sql = f"({' OR '.join(clauses)})" if clauses else '0'
+        if isinstance(op, ast.NotIn):
+            return f"({sql} IS NOT 1)"
+        return sql if conjunctive else f"({sql} IS 1)"
+    if isinstance(value, list):
+        return None
+
+    if isinstance(op, (ast.Is, ast.IsNot)):
+        if value is not None:
+            return None
+        op = ast.Eq() if isinstance(op, ast.Is) else ast.NotEq()
+    value = _coerce_query_value(column, ftype, value)
+    if value is None:
+        if not isinstance(op, (ast.Eq, ast.NotEq)):
+            return '0' if conjunctive else None # None can't be ordered: Python raises
+        if ftype == 'Number':
+            return '0' if isinstance(op, ast.Eq) else '1' # An unset Number reads as 0, never None
+        sql = _unset_sql(column, ftype)
+        return sql if isinstance(op, ast.Eq) else f"NOT {sql}"
+    if ftype != 'Number' and not isinstance(op, (ast.Eq, ast.NotEq)) and not conjunctive:
+        return None
+    params.append(value)
+    sql = f"{column} {_SQL_COMPARISONS[type(op)]} ?"
+    # Unset numbers read as 0, so they match whenever 0 does; other unset values only match !=
+    if ftype == 'Number':
+        matches_unset = _PY_COMPARISONS[type(op)](0, value)
+    else:
+        matches_unset = isinstance(op, ast.NotEq)
+    if matches_unset:
+        return f"({sql} OR {column} IS NULL)"
+    # Under `and` alone NULL and false select the same rows, and the plain form can use an index
+    return sql if conjunctive else f"(({sql}) IS 1)"
+
+def _compile_predicate(node, lookup, params, conjunctive=True):
+    """Compiles a where expression to SQL, or returns None if any part of it needs Python."""
+    if isinstance(node, ast.BoolOp):
+        inner = conjunctive and isinstance(node.op, ast.And)
+        parts = [_compile_predicate(v, lookup, params, inner) for v in node.values]
+        if any(p is None for p in parts):
+            return None
+        joiner = ' AND ' if isinstance(node.op, ast.And) else ' OR '
+        return f"({joiner.join(parts)})"
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        # Every compiled term is 0 or 1, never NULL, so NOT matches Python's `not`
+        inner = _compile_predicate(node.operand, lookup, params, False)
+        return None if inner is None else f"NOT {inner}"
+    if not isinstance(node, ast.Compare):
+        return None
+
+    parts = []
+    operands = [node.left] + node.comparators
+    for left, op, right in zip(operands, node.ops, operands[1:]):
+        field, const = _query_field_ref(left, lookup), right
+        if field is None:
+            field, const = _query_field_ref(right, lookup), left
+            if field is None or isinstance(op, (ast.In, ast.NotIn)):
+                return None
+            op = _FLIPPED_COMPARISONS.get(type(op), type(op))()
+        column, ftype = field
+        if ftype in ('Formula', 'NestedDatabase'):
+            return None
+        try:
+            value = _query_constant(const)
+        except (ValueError, TypeError, SyntaxError):
+            return None
+        sql = _compile_comparison(column, ftype, op, value, params, conjunctive)
+        if sql is None:
+            return None
+        parts.append(sql)
+    return parts[0] if len(parts) == 1 else f"({' AND '.join(parts)})"
+
+class _QueryRowRewriter(ast.NodeTransformer):
+    """Rewrites bare field names in a where term to row['safe_name'] for Python evaluation."""
+    def __init__(self, lookup):
+        self._lookup = lookup
+
+    def visit_Name(self, node):
+        if node.id in ('row', 'rows') or node.id in _FORMULA_BUILTINS:
+            return node
+        field = _resolve_query_field(node.id, self._lookup)
+        if field is None:
+            raise ValueError(f"Unknown field in where: {node.id}")
+        return ast.copy_location(ast.Subscript(value=ast.Name(id='row', ctx=ast.Load()), slice=ast.Constant(field[0]), ctx=ast.Load()), node)
+
+def _parse_item_query(args, fields):
+    """
+    Parses ?where=, ?order_by= and ?fields= into a query plan, or returns None when the
+    request has none of them. Raises ValueError for malformed input or unknown fields.
+    """
+    if not any(args.get(k) for k in ('where', 'order_by', 'fields')):
+        return None
+    lookup = _build_lookup(fields)
+    clauses, params, residual = [], [], []
+
+    if args.get('where'):
+        try:
+            tree = ast.parse(args['where'], mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Invalid where expression: {e.msg}")
+        body = tree.body
+        terms = body.values if isinstance(body, ast.BoolOp) and isinstance(body.op, ast.And) else [body]
+        for term in terms:
+            term_params = []
+            sql = _compile_predicate(term, lookup, term_params)
+            if sql is not None:
+                clauses.append(sql)
+                params += term_params
+                continue
+            source = ast.unparse(_QueryRowRewriter(lookup).visit(term))
+            try:
+                residual.append((source, database.compile_formula(source)))
+            except (SyntaxError, ValueError) as e:
+                raise ValueError(f"Invalid where expression: {e}")
+
+    order = []
+    for key in (args.get('order_by') or '').split(','):
+        key = key.strip()
+        if not key:
+            continue
+        desc = key.startswith('-')
+        field = _resolve_query_field(key.lstrip('-+').strip(), lookup)
+        if field is None:
+            raise ValueError(f"Unknown field in order_by: {key.lstrip('-+')}")
+        if field[1] == 'NestedDatabase':
+            raise ValueError(f"Cannot order by a nested database: {key.lstrip('-+')}")
+        order.append((field[0], desc, field[1] == 'Formula'))
+    if not order:
+        order = [('created_at', True, False), ('id', True, False)]
+    elif all(col != 'id' for col, _, _ in order):
+        order.append(('id', order[-1][1], False))
+
+    selected = None
+    if args.get('fields'):
+        selected = []
+        for name in args['fields'].split(','):
+            if not name.strip():
+                continue
+            field = _resolve_query_field(name.strip(), lookup)
+            if field is None:
+                raise ValueError(f"Unknown field: {name.strip()}")
+            if field[0] not in selected:
+                selected.append(field[0])
+
+    formula_fields = [f for f in fields if f.get('type') == 'Formula' and (selected is None or f['safe_name'] in selected)]
+    in_python = bool(residual) or any(is_formula for _, _, is_formula in order)
+    if selected is not None and not formula_fields and not in_python:
+        # Nothing gets evaluated (no formula is returned or sorted on), so only the physical
+        # columns that are returned or sorted on are read
+        columns = ', '.join(dict.fromkeys(['id'] + [col for col, _, _ in order] + selected))
+    else:
+        columns = '*'
+    return {
+        'where': ' AND '.join(clauses), 'params': params, 'residual': residual,
+        'order': order, 'in_python': in_python, 'fields': selected,
+        'formula_fields': formula_fields, 'columns': columns,
+    }
+
+def _query_sort_value(val):
+    """Orders values like RowList.sort (None, then numbers, then text) in a JSON-safe form."""
+    if val is None:
+        return [0, '']
+    if isinstance(val, (int, float)):
+        return [1, val]
+    return [2, str(val)]
+
+def _query_row_key(row, order):
+    # Stored columns are compared raw, matching SQL ORDER BY; formulas evaluate through SmartRow
+    return [_query_sort_value(row[col] if is_formula else dict.get(row, col)) for col, _, is_formula in order]
+
+def _encode_query_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def _decode_query_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not all(isinstance(k, list) and len(k) == 2 and k[0] in (0, 1, 2) for k in key):
+            raise ValueError
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return key
+
+def _key_after(key, cursor, order):
+    """True if a row with sort key `key` comes strictly after the cursor in `order`."""
+    for k, c, (_, desc, _) in zip(key, cursor, order):
+        if k != c:
+            return (k > c) != desc
+    return False
+
+def _keyset_sql(order, cursor, params):
+    """SQL for rows strictly after the cursor, following SQLite's NULLS FIRST/LAST defaults."""
+    expr = None
+    for (column, desc, _), (rank, value) in reversed(list(zip(order, cursor))):
+        value = None if rank == 0 else value
+        step = []
+        if value is None:
+            after = '0' if desc else f"{column} IS NOT NULL"
+        else:
+            after = f"({column} < ? OR {column} IS NULL)" if desc else f"{column} > ?"
+            step.append(value)
+        if expr is not None:
+            after = f"({after} OR ({column} IS ? AND {expr[0]}))"
+            step += [value] + expr[1]
+        expr = (after, step)
+    params += expr[1]
+    return expr[0]
 
-            def __getattr__(self, name):
-                self._ensure_loaded()
-                return getattr(self._smart_row, name)
+def _query_matches(code, row, all_rows):
+    try:
+        return bool(eval(code, _formula_env(row=row, rows=all_rows)))
+    except Exception:
+        return False
+
+def _run_item_query(conn, table_name, fields, summary_defs, loader, query, page_args, python_summaries):
+    """Returns (page_rows, wrapped_rows, next_cursor) for a parsed item query."""
+    limit, after = page_args if page_args is not None else (None, None)
+    order = query['order']
+    evaluates = query['in_python'] or query['formula_fields']
+    needs_all_rows = python_summaries or (evaluates and (
+        any(database.formula_reads_rows(f.get('expression')) for f in fields if f.get('type') == 'Formula')
+        or any(database.formula_reads_rows(source) for source, _ in query['residual'])))
+
+    wrapped_rows = by_id = None
+    if needs_all_rows:
+        items = conn.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC, id DESC').fetchall()
+        wrapped_rows = RowList([dict(ix) for ix in items], fields, summary_defs, loader)
+        by_id = {row['id']: row for row in wrapped_rows}
+
+    params = list(query['params'])
+    clauses = [query['where']] if query['where'] else []
+    next_cursor = None
+
+    if not query['in_python']:
+        if after:
+            clauses.append(_keyset_sql(order, after, params))
+        sql = f"SELECT {query['columns'] if by_id is None else 'id'} FROM {table_name}"
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        sql += ' ORDER BY ' + ', '.join(f"{col} {'DESC' if desc else 'ASC'}" for col, desc, _ in order)
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit + 1)
+        items = database.execute_planned(conn, sql, params).fetchall()
+        if limit and len(items) > limit:
+            items = items[:limit]
+            next_cursor = True
+        if by_id is not None:
+            page_rows = [by_id[ix['id']] for ix in items if ix['id'] in by_id]
+        else:
+            page_rows = RowList([dict(ix) for ix in items], fields, summary_defs, loader)
+        if next_cursor:
+            next_cursor = _encode_query_cursor(_query_row_key(page_rows[-1], order))
+        return page_rows, wrapped_rows, next_cursor
+
+    # Residual predicates or formula sort keys: SQL narrows the rows, Python finishes the job
+    sql = f"SELECT {'*' if by_id is None else 'id'} FROM {table_name}"
+    if clauses:
+        sql += f" WHERE {' AND '.join(clauses)}"
+    items = database.execute_planned(conn, sql, params).fetchall()
+    if by_id is not None:
+        candidates = [by_id[ix['id']] for ix in items if ix['id'] in by_id]
+    else:
+        candidates = RowList([dict(ix) for ix in items], fields, summary_defs, loader)
+    loader.queue_rows(candidates, fields)
+    all_rows = wrapped_rows if wrapped_rows is not None else candidates
+    for _, code in query['residual']:
+        candidates = [row for row in candidates if _query_matches(code, row, all_rows)]
+
+    keyed = [(_query_row_key(row, order), row) for row in candidates]
+    for i in reversed(range(len(order))):
+        keyed.sort(key=lambda pair: pair[0][i], reverse=order[i][1])
+    if after:
+        keyed = [pair for pair in keyed if _key_after(pair[0], after, order)]
+    if limit and len(keyed) > limit:
+        keyed = keyed[:limit]
+        next_cursor = _encode_query_cursor(keyed[-1][0])
+    return [row for _, row in keyed], wrapped_rows, next_cursor
+
+@app.route('/api/collections/<collection_id>/items', methods=['GET'])
+def get_items(collection_id):
+    """
+    Returns items inside a specific collection, computing formulas dynamically.
+    Passing ?limit= and/or ?after=<cursor> switches to keyset pagination: only the
+    rows of the requested page are evaluated, while summaries still cover every row.
+    ?where=, ?order_by= and ?fields= filter, sort and trim the items (see Item queries);
+    cursors then follow the requested order.
+    With ?debug=1 (or when the app runs in debug mode) the summary plan is included.
+    Responses carry an ETag (database.items_etag); If-None-Match gets a 304.
+    """
+    table_name, schema = _get_table_metadata(collection_id)
+    if not table_name:
+        return jsonify({'error': 'Collection not found'}), 404
 
-            def __getitem__(self, key):
-                self._ensure_loaded()
-                return self._smart_row[key]
+    try:
+        query = _parse_item_query(request.args, schema.get('fields', []))
+        page_args = _parse_page_args(request.args, _decode_query_cursor if query else _decode_cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-            def __repr__(self):
-                return f"<RelationProxy {self.target_collection_id}:{self.target_item_id}>"
+    # Taken before reading any rows, so a concurrent write can only make it look older
+    etag = database.items_etag(collection_id)
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+        
+    conn = database.get_db_connection()
+    try:
+        fields = schema.get('fields', [])
+        summary_defs = schema.get('summary_formulas', [])
+        formula_fields = [f for f in fields if f.get('type') == 'Formula']
+        next_cursor = None
+        loader = RelationLoader()
+        pushed, summary_plan = _pushdown_summaries(conn, collection_id, table_name, summary_defs, database.build_field_lookup(fields))
+        python_summaries = len(pushed) < len(summary_defs)
 
-        wrapped_rows = RowList(items_list, schema.get('fields', []), schema.get('summary_formulas', []))
+        if query is not None:
+            page_rows, wrapped_rows, next_cursor = _run_item_query(
+                conn, table_name, fields, summary_defs, loader, query, page_args, python_summaries)
+            formula_fields = query['formula_fields']
+        elif page_args is None:
+            items = conn.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC, id DESC').fetchall()
+            wrapped_rows = RowList([dict(ix) for ix in items], fields, summary_defs, loader)
+            page_rows = wrapped_rows
+        else:
+            limit, after = page_args
+            if after:
+                page_items = conn.execute(
+                    f'SELECT * FROM {table_name} WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+                    (after[0], after[1], limit + 1)
+                ).fetchall()
+            else:
+                page_items = conn.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC, id DESC LIMIT ?', (limit + 1,)).fetchall()
+            if len(page_items) > limit:
+                page_items = page_items[:limit]
+                next_cursor = _encode_cursor(page_items[-1])
 
+            # Row formulas may reference `rows`, and so do summaries that could not be pushed
+            # down to SQL, so the full collection is only materialized when one of them needs it.
+            needs_all_rows = python_summaries or any(database.formula_reads_rows(f.get('expression')) for f in formula_fields)
+            if needs_all_rows:
+                items = conn.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC, id DESC').fetchall()
+                wrapped_rows = RowList([dict(ix) for ix in items], fields, summary_defs, loader)
+                by_id = {row['id']: row for row in wrapped_rows}
+                page_rows = [by_id[ix['id']] for ix in page_items if ix['id'] in by_id]
+            else:
+                wrapped_rows = None
+                page_rows = RowList([dict(ix) for ix in page_items], fields, summary_defs, loader)
         
         # 1. Evaluate Row-level formulas (triggered by lazy-loading)
-        formula_fields = [f for f in schema.get('fields', []) if f.get('type') == 'Formula']
-        if formula_fields:
-            for ff in formula_fields:
-                for row in wrapped_rows:
-                    # Accessing the field triggers calculation if not already done
-                    _ = row[ff['name']]
+        loader.queue_rows(page_rows, fields)
+        for ff in formula_fields:
+            for row in page_rows:
+                # Accessing the field triggers calculation if not already done
+                _ = row[ff['name']]
                             
         # 2. Evaluate Database Summary Formulas
-        summaries = []
-        summary_defs = schema.get('summary_formulas', [])
-        for sdf in summary_defs:
-            expr = sdf.get('expression', '')
-            val = None
-            if expr:
-                try:
-                    val = eval(expr, {"__builtins__": {}}, {"rows": wrapped_rows, "sum": sum, "len": len, "max": max, "min": min, "round": round})
-                except Exception as eval_err:
-                    val = f"Err: {eval_err}"
-            summaries.append({
-                'name': sdf.get('name', 'Summary'),
-                'value': val,
-                'expression': expr
-            })
-            
-        return jsonify({
-            'items': wrapped_rows, # Return the smart rows
+        if wrapped_rows is not None and python_summaries:
+            loader.queue_rows(wrapped_rows, fields)
+        summaries = _evaluate_summaries(schema, wrapped_rows, pushed)
+
+        if query is not None and query['fields'] is not None:
+            page_rows = [{k: dict.get(row, k) for k in ['id'] + query['fields']} for row in page_rows]
+
+        response = {
+            'items': page_rows, # Return the smart rows
             'summaries': summaries
-        })
+        }
+        if page_args is not None:
+            response['next_cursor'] = next_cursor
+        if app.debug or request.args.get('debug', '').lower() in ('1', 'true'):
+            response['summary_plan'] = summary_plan
+        return _with_etag(jsonify(response), etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+def _changed_fields(old_row, new_row):
+    """Columns a write changed, for the change log (the set ones, for an insert)."""
+    if old_row is None:
+        return [k for k, v in new_row.items() if v is not None and k not in ('id', 'created_at')]
+    return [k for k, v in new_row.items() if old_row.get(k) != v]
+
+def _title_taken(cursor, table_name, title_field, title_val, exclude_id=None):
+    """Index lookup for another item with this title. Run it in the write's transaction."""
+    query = f"SELECT 1 FROM {table_name} WHERE {title_field} = ?"
+    params = (title_val,)
+    if exclude_id is not None:
+        query += " AND id != ?"
+        params += (exclude_id,)
+    return cursor.execute(query, params).fetchone() is not None
+
 @app.route('/api/collections/<collection_id>/items', methods=['POST'])
 def add_item(collection_id):
     """Creates a new tracked item inside a collection."""
@@ -420,27 +1388,35 @@ def add_item(collection_id):
     if not columns:
         return jsonify({'error': 'No valid fields provided'}), 400
         
-    # Uniqueness check for the 'Title' field (assumed to be the first field in schema)
+    # Uniqueness of the 'Title' field (assumed to be the first field in schema) is checked
+    # inside the write transaction, against the title index (see database._ensure_item_indexes)
     title_field = schema['fields'][0]['safe_name'] if schema.get('fields') else None
-    if title_field and title_field in data:
-        title_val = data[title_field]
-        exists_conn = database.get_db_connection()
-        try:
-            exists = exists_conn.execute(f"SELECT 1 FROM {table_name} WHERE {title_field} = ?", (title_val,)).fetchone()
-            if exists:
-                return jsonify({'error': f"An entry with the title '{title_val}' already exists."}), 400
-        finally:
-            exists_conn.close()
+    title_val = data.get(title_field) if title_field else None
+    duplicate_error = {'error': f"An entry with the title '{title_val}' already exists."}
 
     query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
     
     conn = database.get_db_connection()
     try:
         cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        if title_field in columns and _title_taken(cursor, table_name, title_field, title_val):
+            conn.rollback()
+            return jsonify(duplicate_error), 400
         cursor.execute(query, tuple(values))
-        conn.commit()
         new_id = cursor.lastrowid
+        new_row = cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (new_id,)).fetchone()
+        database.apply_aggregate_change(cursor, collection_id, new_row=dict(new_row))
+        database.sync_calendar_event(cursor, collection_id, schema, new_id, dict(new_row))
+        database.sync_search_documents(cursor, collection_id, schema, [], [dict(new_row)])
+        database.bump_collection_version(cursor, collection_id)
+        database.record_change(cursor, collection_id, 'item.create', new_id, _changed_fields(None, dict(new_row)))
+        conn.commit()
+        _refresh_materialized_after_write(collection_id, [new_id])
         return jsonify({'id': new_id, 'message': 'Item created successfully'}), 201
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify(duplicate_error), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -467,18 +1443,10 @@ def update_item(collection_id, item_id):
     if not updates:
         return jsonify({'error': 'No valid fields provided to update'}), 400
 
-    # Uniqueness check for the 'Title' field (assumed to be the first field in schema)
+    # Uniqueness check for the 'Title' field (assumed to be the first field in schema), done in the write transaction
     title_field = schema['fields'][0]['safe_name'] if schema.get('fields') else None
-    if title_field and title_field in data:
-        title_val = data[title_field]
-        exists_conn = database.get_db_connection()
-        try:
-            # Check specifically if ANOTHER item has this title
-            exists = exists_conn.execute(f"SELECT 1 FROM {table_name} WHERE {title_field} = ? AND id != ?", (title_val, item_id)).fetchone()
-            if exists:
-                return jsonify({'error': f"An entry with the title '{title_val}' already exists elsewhere in this collection."}), 400
-        finally:
-            exists_conn.close()
+    title_val = data.get(title_field) if title_field else None
+    duplicate_error = {'error': f"An entry with the title '{title_val}' already exists elsewhere in this collection."}
         
     values.append(item_id)
     query = f"UPDATE {table_name} SET {', '.join(updates)} WHERE id = ?"
@@ -486,19 +1454,33 @@ def update_item(collection_id, item_id):
     conn = database.get_db_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute(query, tuple(values))
-        conn.commit()
-        if cursor.rowcount == 0:
+        cursor.execute('BEGIN IMMEDIATE')
+        old_row = cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (item_id,)).fetchone()
+        if old_row is None:
+            conn.rollback()
             return jsonify({'error': 'Item not found'}), 404
+        # Check specifically if ANOTHER item has this title
+        if title_field in valid_fields and title_field in data and _title_taken(cursor, table_name, title_field, title_val, item_id):
+            conn.rollback()
+            return jsonify(duplicate_error), 400
+        cursor.execute(query, tuple(values))
+        new_row = cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (item_id,)).fetchone()
+        database.apply_aggregate_change(cursor, collection_id, dict(old_row), dict(new_row))
+        database.sync_calendar_event(cursor, collection_id, schema, item_id, dict(new_row))
+        database.sync_search_documents(cursor, collection_id, schema, [item_id], [dict(new_row)])
+        database.bump_collection_version(cursor, collection_id)
+        database.record_change(cursor, collection_id, 'item.update', item_id, _changed_fields(dict(old_row), dict(new_row)))
             
         # Sync nested database names if the title changed
-        if title_field and title_field in data:
-            new_title = data[title_field]
-            nested_db = database.get_nested_collections(item_id)
-            for db in nested_db:
-                database.rename_collection(db['id'], new_title)
+        if title_field and data.get(title_field) is not None:
+            database.rename_nested_collections(cursor, collection_id, {item_id: data[title_field]})
+        conn.commit()
                 
+        _refresh_materialized_after_write(collection_id, [item_id])
         return jsonify({'message': 'Item updated successfully'})
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify(duplicate_error), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -507,28 +1489,596 @@ def update_item(collection_id, item_id):
 @app.route('/api/collections/<collection_id>/items/<int:item_id>', methods=['DELETE'])
 def delete_item(collection_id, item_id):
     """Deletes an item from the collection."""
-    table_name, _ = _get_table_metadata(collection_id)
+    table_name, schema = _get_table_metadata(collection_id)
     if not table_name:
         return jsonify({'error': 'Collection not found'}), 404
         
-    # Cascade delete any databases that belong to this item
-    nested_db = database.get_nested_collections(item_id)
-    for db in nested_db:
-        database.delete_collection(db['id'])
-        
     conn = database.get_db_connection()
     try:
         cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        old_row = cursor.execute(f"SELECT * FROM {table_name} WHERE id = ?", (item_id,)).fetchone()
+        if old_row is None:
+            conn.rollback()
+            return jsonify({'error': 'Item not found'}), 404
+        # Cascade delete any databases that belong to this item, in the same transaction
+        database.delete_collections_in_transaction(cursor, database.nested_collection_ids(cursor, collection_id, [item_id]))
         cursor.execute(f"DELETE FROM {table_name} WHERE id = ?", (item_id,))
+        database.apply_aggregate_change(cursor, collection_id, old_row=dict(old_row))
+        database.sync_calendar_event(cursor, collection_id, schema, item_id)
+        database.sync_search_documents(cursor, collection_id, schema, [item_id])
+        database.bump_collection_version(cursor, collection_id)
+        database.record_change(cursor, collection_id, 'item.delete', item_id)
         conn.commit()
-        if cursor.rowcount == 0:
-            return jsonify({'error': 'Item not found'}), 404
+        _refresh_materialized_after_write(collection_id, [])
         return jsonify({'message': 'Item deleted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+# --- Bulk import ---
+# Rows are parsed from the request stream and written in chunks: one transaction and one
+# executemany per chunk, with the title check done against the title index for the whole
+# chunk at once. Rows that fail validation are reported and skipped; the rest still load.
+
+BULK_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+BUILTIN_ITEM_COLUMNS = ['recurrence_rule', 'recurrence_end_date', 'recurrence_days', 'end_date_time', 'is_all_day']
+
+def _bulk_format(req):
+    fmt = (req.args.get('format') or '').lower()
+    if not fmt:
+        content_type = (req.mimetype or '').lower()
+        if 'csv' in content_type:
+            fmt = 'csv'
+        elif 'ndjson' in content_type or 'jsonl' in content_type or 'json' in content_type:
+            fmt = 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError('Send text/csv or application/x-ndjson (or pass ?format=csv|ndjson)')
+    return fmt
+
+def _bulk_records(fmt, stream):
+    """Yields (row_number, dict or error message) from a CSV or NDJSON stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f'Invalid JSON: {e}'
+            continue
+        yield line_no, record if isinstance(record, dict) else 'Each line must be a JSON object'
+
+def _bulk_column_map(schema):
+    """Maps accepted headers (safe_name, display name or its loose form) to (column, type)."""
+    mapping = {c: (c, 'Builtin') for c in BUILTIN_ITEM_COLUMNS}
+    for f in schema['fields']:
+        if f.get('type') == 'Formula':
+            continue
+        target = (f['safe_name'], f['type'])
+        mapping[_normalize(f['name'])] = target
+        mapping[f['name']] = target
+        mapping[f['safe_name']] = target
+    return mapping
+
+def _coerce_import_value(column, ftype, value):
+    if value is None or (isinstance(value, str) and value.strip() == ''):
+        return None
+    if ftype == 'Number':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column}: '{value}' is not a number")
+    if ftype == 'Relation':
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column}: '{value}' is not an item id")
+    if ftype == 'DateTime' or column in ('recurrence_end_date', 'end_date_time'):
+        try:
+            datetime.datetime.fromisoformat(str(value))
+        except ValueError:
+            raise ValueError(f"{column}: '{value}' is not an ISO date")
+        return str(value)
+    if column == 'is_all_day':
+        return 1 if str(value).lower() in ('1', 'true', 'yes') else 0
+    return value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+def _insert_import_chunk(conn, collection_id, table_name, schema, title_field, chunk, report):
+    """Writes one chunk of (row_number, values) in a single transaction. Returns the new item ids."""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        if title_field:
+            titles = [values[title_field] for _, values in chunk if values.get(title_field) is not None]
+            taken = set()
+            for batch in database.in_batches(titles):
+                taken.update(r[0] for r in cursor.execute(
+                    f"SELECT {title_field} FROM {table_name} WHERE {title_field} IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall())
+            kept = []
+            for row_no, values in chunk:
+                if values.get(title_field) in taken:
+                    report(row_no, f"An entry with the title '{values[title_field]}' already exists.")
+                else:
+                    kept.append((row_no, values))
+            chunk = kept
+
+        # Consecutive rows with the same columns share one executemany, so ids follow the
+        # file order; absent columns keep their defaults
+        before = cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table_name}").fetchone()[0]
+        for columns, run in itertools.groupby((values for _, values in chunk), key=tuple):
+            cursor.executemany(
+                f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(values.values()) for values in run]
+            )
+
+        # AUTOINCREMENT ids only grow, and BEGIN IMMEDIATE keeps other writers out
+        new_rows = [dict(r) for r in cursor.execute(f"SELECT * FROM {table_name} WHERE id > ?", (before,)).fetchall()]
+        database.apply_aggregate_changes(cursor, collection_id, [(None, r) for r in new_rows])
+        database.sync_calendar_events(cursor, collection_id, schema, [], new_rows)
+        database.sync_search_documents(cursor, collection_id, schema, [], new_rows)
+        database.bump_collection_version(cursor, collection_id)
+        database.record_changes(cursor, [(collection_id, r['id'], 'item.create', _changed_fields(None, r)) for r in new_rows])
+        conn.commit()
+        return [r['id'] for r in new_rows]
+    except Exception as e:
+        conn.rollback()
+        for row_no, _ in chunk:
+            report(row_no, str(e))
+        return []
+
+@app.route('/api/collections/<collection_id>/items/bulk', methods=['POST'])
+def bulk_import_items(collection_id):
+    """
+    Imports many items from a CSV (header row) or NDJSON (one object per line) body.
+    Columns may be named by safe_name or display name; unknown columns are ignored and
+    listed. Titles must be unique within the file and against existing items.
+    """
+    table_name, schema = _get_table_metadata(collection_id)
+    if not table_name:
+        return jsonify({'error': 'Collection not found'}), 404
+    try:
+        fmt = _bulk_format(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    column_map = _bulk_column_map(schema)
+    title_field = schema['fields'][0]['safe_name'] if schema.get('fields') and schema['fields'][0].get('type') != 'Formula' else None
+    errors, ignored = [], set()
+    failed = inserted = 0
+    seen_titles = set()
+
+    def report(row_no, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': row_no, 'error': message})
+
+    started = time.perf_counter()
+    conn = database.get_db_connection()
+    try:
+        chunk, new_ids = [], []
+        for row_no, record in _bulk_records(fmt, request.stream):
+            if isinstance(record, str):
+                report(row_no, record)
+                continue
+            values = {}
+            try:
+                for key, value in record.items():
+                    target = column_map.get(key) or column_map.get(_normalize(key))
+                    if target is None:
+                        ignored.add(key)
+                        continue
+                    column, ftype = target
+                    values[column] = _coerce_import_value(column, ftype, value)
+            except ValueError as e:
+                report(row_no, str(e))
+                continue
+            if not any(v is not None for v in values.values()):
+                report(row_no, 'No valid fields provided')
+                continue
+            title = values.get(title_field) if title_field else None
+            if title is not None:
+                if title in seen_titles:
+                    report(row_no, f"Duplicate title '{title}' in this import")
+                    continue
+                seen_titles.add(title)
+
+            chunk.append((row_no, values))
+            if len(chunk) >= BULK_CHUNK_SIZE:
+                new_ids += _insert_import_chunk(conn, collection_id, table_name, schema, title_field, chunk, report)
+                chunk = []
+        if chunk:
+            new_ids += _insert_import_chunk(conn, collection_id, table_name, schema, title_field, chunk, report)
+        inserted = len(new_ids)
+    except UnicodeDecodeError as e:
+        return jsonify({'error': f'Body is not UTF-8: {e}'}), 400
+    except csv.Error as e:
+        return jsonify({'error': f'Malformed CSV: {e}'}), 400
+    finally:
+        conn.close()
+
+    if new_ids:
+        _refresh_materialized_after_write(collection_id, new_ids)
+    elapsed = time.perf_counter() - started
+    errors.sort(key=lambda e: e['row']) # Title clashes are only found when their chunk is written
+    return jsonify({
+        'inserted': inserted,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors),
+        'ignored_columns': sorted(ignored),
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'rows_per_second': round(inserted / elapsed, 1) if elapsed > 0 else None,
+    })
+
+# --- Bulk update / delete ---
+# Both take {"ids": [...]} or {"filter": {field: value, ...}} (equality on every listed
+# field, null meaning unset) and run as one transaction: rows, summary aggregates, the
+# calendar index and nested-collection cascades/renames commit together.
+
+def _bulk_target_rows(cursor, table_name, schema, data):
+    """Selects the rows a bulk request targets. Raises ValueError for a malformed selection."""
+    if 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            raise ValueError('ids must be a list of item ids')
+        rows = []
+        for batch in database.in_batches(ids):
+            rows += cursor.execute(f"SELECT * FROM {table_name} WHERE id IN ({', '.join('?' * len(batch))})", batch).fetchall()
+        return [dict(r) for r in rows]
+
+    filters = data.get('filter')
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError('Provide ids or a non-empty filter')
+    column_map = _bulk_column_map(schema)
+    clauses, params = [], []
+    for key, value in filters.items():
+        target = column_map.get(key) or column_map.get(_normalize(key))
+        if target is None:
+            raise ValueError(f"Unknown field in filter: {key}")
+        column, ftype = target
+        value = _coerce_import_value(column, ftype, value)
+        if value is None:
+            clauses.append(f"({column} IS NULL OR {column} = '')")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    return [dict(r) for r in database.execute_planned(cursor, f"SELECT * FROM {table_name} WHERE {' AND '.join(clauses)}", params).fetchall()]
+
+@app.route('/api/collections/<collection_id>/items/bulk', methods=['PATCH'])
+def bulk_update_items(collection_id):
+    """Applies {"patch": {field: value}} to every targeted item."""
+    table_name, schema = _get_table_metadata(collection_id)
+    if not table_name:
+        return jsonify({'error': 'Collection not found'}), 404
+    data = request.get_json() or {}
+    patch = data.get('patch')
+    if not isinstance(patch, dict) or not patch:
+        return jsonify({'error': 'patch must be a non-empty object'}), 400
+
+    column_map = _bulk_column_map(schema)
+    title_field = schema['fields'][0]['safe_name'] if schema.get('fields') and schema['fields'][0].get('type') != 'Formula' else None
+    updates = {}
+    try:
+        for key, value in patch.items():
+            target = column_map.get(key) or column_map.get(_normalize(key))
+            if target is None:
+                raise ValueError(f"Unknown field in patch: {key}")
+            column, ftype = target
+            updates[column] = _coerce_import_value(column, ftype, value)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = database.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            old_rows = _bulk_target_rows(cursor, table_name, schema, data)
+        except ValueError as e:
+            conn.rollback()
+            return jsonify({'error': str(e)}), 400
+        ids = [r['id'] for r in old_rows]
+
+        new_title = updates.get(title_field) if title_field else None
+        if new_title is not None:
+            if len(ids) > 1:
+                conn.rollback()
+                return jsonify({'error': 'Titles must be unique, so a bulk update cannot set the title of several items'}), 400
+            if ids and _title_taken(cursor, table_name, title_field, new_title, ids[0]):
+                conn.rollback()
+                return jsonify({'error': f"An entry with the title '{new_title}' already exists elsewhere in this collection."}), 400
+
+        assignments = ', '.join(f"{column} = ?" for column in updates)
+        new_rows = []
+        for batch in database.in_batches(ids):
+            placeholders = ', '.join('?' * len(batch))
+            cursor.execute(f"UPDATE {table_name} SET {assignments} WHERE id IN ({placeholders})", list(updates.values()) + batch)
+            new_rows += [dict(r) for r in cursor.execute(f"SELECT * FROM {table_name} WHERE id IN ({placeholders})", batch).fetchall()]
+
+        by_id = {r['id']: r for r in new_rows}
+        database.apply_aggregate_changes(cursor, collection_id, [(old, by_id[old['id']]) for old in old_rows])
+        database.sync_calendar_events(cursor, collection_id, schema, ids, new_rows)
+        database.sync_search_documents(cursor, collection_id, schema, ids, new_rows)
+        database.bump_collection_version(cursor, collection_id)
+        database.record_changes(cursor, [(collection_id, old['id'], 'item.update', _changed_fields(old, by_id[old['id']])) for old in old_rows])
+        if new_title is not None:
+            database.rename_nested_collections(cursor, collection_id, {i: new_title for i in ids})
+        conn.commit()
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+    _refresh_materialized_after_write(collection_id, ids)
+    return jsonify({'updated': len(ids), 'ids': ids})
+
+@app.route('/api/collections/<collection_id>/items/bulk', methods=['DELETE'])
+def bulk_delete_items(collection_id):
+    """Deletes every targeted item, cascading to the databases nested under them."""
+    table_name, schema = _get_table_metadata(collection_id)
+    if not table_name:
+        return jsonify({'error': 'Collection not found'}), 404
+    data = request.get_json() or {}
+
+    conn = database.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            old_rows = _bulk_target_rows(cursor, table_name, schema, data)
+        except ValueError as e:
+            conn.rollback()
+            return jsonify({'error': str(e)}), 400
+        ids = [r['id'] for r in old_rows]
+
+        nested_removed = database.delete_collections_in_transaction(cursor, database.nested_collection_ids(cursor, collection_id, ids))
+        for batch in database.in_batches(ids):
+            cursor.execute(f"DELETE FROM {table_name} WHERE id IN ({', '.join('?' * len(batch))})", batch)
+        database.apply_aggregate_changes(cursor, collection_id, [(old, None) for old in old_rows])
+        database.sync_calendar_events(cursor, collection_id, schema, ids)
+        database.sync_search_documents(cursor, collection_id, schema, ids)
+        database.bump_collection_version(cursor, collection_id)
+        database.record_changes(cursor, [(collection_id, i, 'item.delete', None) for i in ids])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+    if ids:
+        _refresh_materialized_after_write(collection_id, [])
+    return jsonify({'deleted': len(ids), 'ids': ids, 'nested_collections_deleted': nested_removed})
+
+# --- Streaming export ---
+# The export walks one SELECT with fetchmany and evaluates row formulas a chunk at a time,
+# so memory stays flat however large the collection is. The exception is a formula that
+# reads `rows`: its value depends on the whole collection, so the rows are then loaded
+# once up front (as get_items does) and streamed out of that list in chunks.
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_BUILTIN_COLUMNS = ['id', 'created_at'] + BUILTIN_ITEM_COLUMNS
+
+def _export_columns(schema, requested):
+    """Returns [(key, header, field)] for ?fields= (names or safe_names), or the default set."""
+    fields = [f for f in schema.get('fields', []) if f.get('type') != 'NestedDatabase']
+    if not requested:
+        return [('id', 'id', None)] + [(f['safe_name'], f['name'], f) for f in fields] + [('created_at', 'created_at', None)]
+    by_name = {}
+    for f in fields:
+        for name in (f['safe_name'], f['name'], _normalize(f['name'])):
+            by_name[name] = (f['safe_name'], f['name'], f)
+    for col in EXPORT_BUILTIN_COLUMNS:
+        by_name[col] = (col, col, None)
+    columns = []
+    for name in requested:
+        column = by_name.get(name) or by_name.get(_normalize(name))
+        if column is None:
+            raise ValueError(f"Unknown field: {name}")
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+def _export_value(val):
+    if isinstance(val, (RowList, list, tuple, dict)):
+        return json.dumps(val, default=str)
+    if isinstance(val, RelationProxy):
+        return val.target_item_id
+    return val
+
+@app.route('/api/collections/<collection_id>/export', methods=['GET'])
+def export_items(collection_id):
+    """
+    Streams every item as CSV (default) or NDJSON (?format=ndjson), formulas evaluated.
+    ?fields=a,b,c picks and orders the columns. CSV headers use display names so the file
+    can be loaded back through the bulk import; NDJSON keys are safe_names as in the API.
+    """
+    table_name, schema = _get_table_metadata(collection_id)
+    if not table_name:
+        return jsonify({'error': 'Collection not found'}), 404
+    fmt = (request.args.get('format') or 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    requested = [n.strip() for n in request.args.get('fields', '').split(',') if n.strip()]
+    try:
+        columns = _export_columns(schema, requested)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fields = schema.get('fields', [])
+    summary_defs = schema.get('summary_formulas', [])
+    formulas = [f for _, _, f in columns if f and f.get('type') == 'Formula']
+    needs_all_rows = bool(formulas) and _formulas_read_all_rows(schema)
+
+    def encode(rows):
+        out = io.StringIO()
+        writer = csv.writer(out) if fmt == 'csv' else None
+        for row in rows:
+            for f in formulas:
+                _ = row[f['name']]
+            values = [_export_value(dict.get(row, key)) for key, _, _ in columns]
+            if writer:
+                writer.writerow(['' if v is None else v for v in values])
+            else:
+                out.write(json.dumps(dict(zip([key for key, _, _ in columns], values)), default=str) + '\n')
+        return out.getvalue()
+
+    def generate():
+        conn = database.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if fmt == 'csv':
+                header = io.StringIO()
+                csv.writer(header).writerow([h for _, h, _ in columns])
+                yield header.getvalue()
+            cursor.execute(f'SELECT * FROM {table_name} ORDER BY created_at DESC, id DESC')
+            if needs_all_rows:
+                loader = RelationLoader()
+                all_rows = RowList([dict(r) for r in cursor.fetchall()], fields, summary_defs, loader)
+                loader.queue_rows(all_rows, fields)
+                for start in range(0, len(all_rows), EXPORT_CHUNK_SIZE):
+                    yield encode(all_rows[start:start + EXPORT_CHUNK_SIZE])
+                return
+            while True:
+                batch = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not batch:
+                    break
+                loader = RelationLoader() # Per chunk, so its caches don't grow with the export
+                rows = RowList([dict(r) for r in batch], fields, summary_defs, loader)
+                loader.queue_rows(rows, fields)
+                yield encode(rows)
+        finally:
+            cursor.close()
+            conn.close()
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = re.sub(r'[^A-Za-z0-9_-]+', '_', database.get_collection_metadata(collection_id)['name'] or 'export')
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{extension}"'}
+    )
+
+# --- Change feed ---
+# /api/events tails database.change_log, so it sees writes from every process sharing the
+# database file. Each SSE event id is the record's seq: a reconnecting EventSource sends it
+# back as Last-Event-ID and resumes exactly where it stopped.
+
+EVENTS_POLL_INTERVAL = 0.5
+EVENTS_HEARTBEAT_INTERVAL = 15
+
+def _sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events stream of change records {seq, collection_id, item_id, op, changed_fields}.
+    Starts at the current end of the log unless Last-Event-ID or ?since=<seq> is given;
+    ?collection_id= limits it to one collection. A 'resync' event means records the client
+    asked for were already pruned, so it should refetch instead of patching.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        after = int(since) if since else database.latest_change_seq()
+    except ValueError:
+        return jsonify({'error': 'since must be a change sequence number'}), 400
+    only_collection = request.args.get('collection_id')
+
+    def generate():
+        nonlocal after
+        yield 'retry: 2000\n\n'
+        last_sent = time.monotonic()
+        while True:
+            records, oldest = database.read_changes(after)
+            if oldest is not None and after + 1 < oldest:
+                yield _sse({'oldest_seq': oldest}, event='resync', event_id=oldest - 1)
+                after = oldest - 1
+                last_sent = time.monotonic()
+                continue
+            for record in records:
+                after = record['seq']
+                if only_collection and record['collection_id'] != only_collection:
+                    continue
+                yield _sse(record, event_id=record['seq'])
+                last_sent = time.monotonic()
+            if records and len(records) == 500:
+                continue # More are waiting
+            if time.monotonic() - last_sent >= EVENTS_HEARTBEAT_INTERVAL:
+                yield ': keepalive\n\n' # Also how a dropped client is noticed
+                last_sent = time.monotonic()
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/collections/<collection_id>/aggregates/rebuild', methods=['POST'])
+def rebuild_aggregates(collection_id):
+    """Recomputes the collection's maintained summary aggregates from its rows."""
+    if not database.rebuild_summary_aggregates(collection_id):
+        return jsonify({'error': 'Collection not found'}), 404
+    return jsonify({'message': 'Summary aggregates rebuilt'})
+
+# --- Search ---
+# Full-text search over the Text fields of every collection (database.search_items).
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """
+    Returns ranked hits for ?q= across all collections (or ?collection_id=), each with its
+    collection and item ids, title and a snippet of the matching text. The last word of the
+    query matches as a prefix.
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    return jsonify(database.search_items(q, limit, request.args.get('collection_id')))
+
+@app.route('/api/search/rebuild', methods=['POST'])
+def rebuild_search():
+    """Rebuilds the search index of one collection (?collection_id=) or of every collection."""
+    collection_id = request.args.get('collection_id')
+    if not database.rebuild_search_index(collection_id) and collection_id:
+        return jsonify({'error': 'Collection not found'}), 404
+    return jsonify({'message': 'Search index rebuilt'})
+
+@app.route('/api/formula-cache', methods=['GET'])
+def get_formula_cache_stats():
+    """Reports hit/miss counters of the compiled formula cache for this worker process."""
+    return jsonify(database.get_formula_cache_stats())
+
 @app.route('/api/items/<int:item_id>/nested', methods=['GET'])
 def get_nested_databases(item_id):
     """Fetches all databases nested inside a specific item."""
@@ -538,59 +2088,218 @@ def get_nested_databases(item_id):
 @app.route('/api/calendar/items', methods=['GET'])
 def get_global_calendar():
     """
-    Scans all databases, finds the date field (or created_at), 
-    and returns a unified array of items to plot on the Global Calendar.
+    Returns a unified array of items to plot on the Global Calendar, read from the
+    calendar_events index (each collection's first DateTime field).
+
+    Optional ?start=&end= (ISO datetimes or dates) bound the query to the items that can
+    show up in that window: anything starting before the window ends whose last possible
+    occurrence hasn't ended before it starts.
+    With &expand=1 (and an IANA &tz= for the viewer's wall clock) recurrences are expanded
+    here; see _expand_calendar for the response shape.
+    """
+    try:
+        window = _parse_calendar_window(request.args)
+        expand = request.args.get('expand', '').lower() in ('1', 'true')
+        if expand:
+            if window is None or window[0] == datetime.datetime.min or window[1].year == datetime.MAXYEAR:
+                raise ValueError('expand requires both start and end')
+            tz = _calendar_tz(request.args.get('tz'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = """
+        SELECT e.*, c.name AS collection_name
+        FROM calendar_events e JOIN collections c ON c.id = e.collection_id
     """
+    params = ()
+    if window is not None:
+        # Served by idx_calendar_events_window (see database.sync_calendar_event)
+        query += " WHERE e.last_occurrence >= ? AND e.start_at <= ?"
+        params = (_calendar_ts(window[0]), _calendar_ts(window[1]))
+
     conn = database.get_db_connection()
     try:
-        collections = database.get_collections()
-        calendar_events = []
-        
-        for coll in collections:
-            table_name = coll['table_name']
-            schema = coll['schema']
-            
-            # Find an explicit Date field to use
-            date_field = None
-            for f in schema.get('fields', []):
-                if f['type'] == 'DateTime':
-                    date_field = f['safe_name']
-                    break
-            
-            if not date_field:
-                continue
+        calendar_events = [{
+            'id': row['item_id'],
+            'collection_id': row['collection_id'],
+            'collection_name': row['collection_name'],
+            'title': row['title'],
+            'date': row['start_at'],
+            'recurrence_rule': row['recurrence_rule'] or 'NONE',
+            'recurrence_end_date': row['recurrence_end_date'],
+            'recurrence_days': row['recurrence_days'],
+            'end_date_time': row['end_at'],
+            'is_all_day': row['is_all_day'] or 0,
+        } for row in conn.execute(query, params).fetchall()]
 
-            # Title field is usually the first field
-            title_field = 'id'
-            if schema.get('fields'):
-                title_field = schema['fields'][0]['safe_name']
-                
-            query = f"SELECT id, recurrence_rule, recurrence_end_date, recurrence_days, end_date_time, is_all_day, {title_field} as title, {date_field} as date_val FROM {table_name}"
-            try:
-                rows = conn.execute(query).fetchall()
-                for row in rows:
-                    if row['date_val']:
-                        calendar_events.append({
-                            'id': row['id'],
-                            'collection_id': coll['id'],
-                            'collection_name': coll['name'],
-                            'title': row['title'],
-                            'date': row['date_val'],
-                            'recurrence_rule': row['recurrence_rule'] if 'recurrence_rule' in row.keys() else 'NONE',
-                            'recurrence_end_date': row['recurrence_end_date'] if 'recurrence_end_date' in row.keys() else None,
-                            'recurrence_days': row['recurrence_days'] if 'recurrence_days' in row.keys() else None,
-                            'end_date_time': row['end_date_time'] if 'end_date_time' in row.keys() else None,
-                            'is_all_day': row['is_all_day'] if 'is_all_day' in row.keys() else 0,
-                        })
-            except Exception as table_err:
-                print(f"Skipping table {table_name} for calendar: {table_err}")
-                
+        if expand:
+            return jsonify(_expand_calendar(calendar_events, window, tz))
         return jsonify(calendar_events)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
 
+# Window bounds are normalised to the calendar index's timestamp shape (the client's
+# toISOString() output, e.g. 2026-03-04T03:25:00.000Z) and compared as strings.
+_calendar_ts = database.calendar_timestamp
+
+def _parse_calendar_bound(value, end_of_day):
+    value = value.strip()
+    try:
+        if len(value) == 10:
+            dt = datetime.datetime.strptime(value, '%Y-%m-%d')
+            if end_of_day:
+                dt += datetime.timedelta(days=1, milliseconds=-1)
+            return dt
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _parse_calendar_window(args):
+    """Returns (start_dt, end_dt) from ?start=&end=, or None when neither is given."""
+    start, end = args.get('start'), args.get('end')
+    if not start and not end:
+        return None
+    start_dt = _parse_calendar_bound(start, False) if start else datetime.datetime.min
+    end_dt = _parse_calendar_bound(end, True) if end else datetime.datetime.max.replace(microsecond=0)
+    if end_dt < start_dt:
+        raise ValueError('end must not be before start')
+    return start_dt, end_dt
+
+# --- Recurrence Engine ---
+# Server-side counterpart of getEventsByDate in static/script.js. Occurrences keep the
+# series' local wall-clock time, so stepping happens on dates in the viewer's timezone and
+# is converted back to UTC per occurrence (DST shifts keep the same local time). Each rule
+# jumps straight to the first candidate date in the window instead of walking day by day.
+# MONTHLY/YEARLY skip months/years that lack the start day (the 31st, Feb 29).
+
+MAX_OCCURRENCES_PER_SERIES = 5000
+
+def _calendar_tz(name):
+    if not name:
+        return datetime.timezone.utc
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'Unknown timezone: {name}')
+
+def _parse_stored_dt(value, tz):
+    """Parses a stored ISO string to an aware datetime; naive values are read as tz-local."""
+    if not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=tz)
+
+def _recurrence_dates(rule, base_day, days, lo, hi):
+    """Yields the candidate local dates of a series in [lo, hi], ascending."""
+    lo = max(lo, base_day)
+    if lo > hi:
+        return
+    if rule == 'DAILY':
+        for n in range((hi - lo).days + 1):
+            yield lo + datetime.timedelta(days=n)
+    elif rule == 'WEEKLY':
+        # recurrence_days holds JS getDay() numbers (0 = Sunday); Python's weekday() is 0 = Monday
+        weekdays = sorted({int(d) for d in days.split(',') if d.strip().isdigit()}) if days else []
+        if not weekdays:
+            first = base_day + datetime.timedelta(days=-(-(lo - base_day).days // 7) * 7)
+            for n in range((hi - first).days // 7 + 1 if first <= hi else 0):
+                yield first + datetime.timedelta(days=7 * n)
+            return
+        firsts = sorted(lo + datetime.timedelta(days=(wd - (lo.weekday() + 1) % 7) % 7) for wd in weekdays)
+        week = 0
+        while True:
+            batch = [d + datetime.timedelta(days=7 * week) for d in firsts]
+            batch = [d for d in batch if d <= hi]
+            if not batch:
+                return
+            yield from batch
+            week += 1
+    elif rule in ('MONTHLY', 'YEARLY'):
+        step = 1 if rule == 'MONTHLY' else 12
+        offset = (lo.year - base_day.year) * 12 + lo.month - base_day.month
+        n = max(0, offset // step)
+        while True:
+            months = base_day.month - 1 + n * step
+            year, month = base_day.year + months // 12, months % 12 + 1
+            if datetime.date(year, month, 1) > hi:
+                return
+            try:
+                day = datetime.date(year, month, base_day.day)
+            except ValueError:
+                day = None
+            if day and lo <= day <= hi:
+                yield day
+            n += 1
+    elif lo == base_day:
+        # Unknown rules behave like the client: only the first occurrence
+        yield base_day
+
+def _event_occurrences(event, window_start, window_end, tz):
+    """Returns [(start, end)] aware datetimes of an event's occurrences overlapping the window."""
+    base = _parse_stored_dt(event['date'], tz)
+    if base is None:
+        return []
+    base = base.astimezone(tz)
+    all_day = event.get('is_all_day') == 1
+    end = _parse_stored_dt(event.get('end_date_time'), tz)
+    duration = end - base if end and end > base else datetime.timedelta(0)
+
+    rule = event.get('recurrence_rule') or 'NONE'
+    if rule == 'NONE':
+        days = [base.date()]
+    else:
+        # A span can start before the window and still reach into it
+        lo = (window_start - duration).astimezone(tz).date() - datetime.timedelta(days=1)
+        hi = window_end.astimezone(tz).date()
+        rec_end = _parse_stored_dt(event.get('recurrence_end_date'), tz)
+        if rec_end is not None:
+            hi = min(hi, rec_end.astimezone(tz).date())
+        days = _recurrence_dates(rule, base.date(), event.get('recurrence_days'), lo, hi)
+
+    occurrences = []
+    for day in days:
+        start = datetime.datetime.combine(day, base.time(), tzinfo=tz)
+        if all_day:
+            span_start = datetime.datetime.combine(day, datetime.time(), tzinfo=tz)
+            span_end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(), tzinfo=tz)
+        else:
+            span_start, span_end = start, start + duration
+        if span_start > window_end:
+            break
+        if span_end < window_start:
+            continue
+        occurrences.append((start, start + duration if end else None))
+        if len(occurrences) >= MAX_OCCURRENCES_PER_SERIES:
+            break
+    return occurrences
+
+def _expand_calendar(events, window, tz):
+    """
+    Compact expansion: {'series': [event, ...], 'occurrences': [[series_index, date, end_date_time], ...]}.
+    Each series is listed once; an occurrence is that event moved to a new date (and end).
+    """
+    window_start = window[0].replace(tzinfo=datetime.timezone.utc)
+    window_end = window[1].replace(tzinfo=datetime.timezone.utc)
+    utc = lambda dt: _calendar_ts(dt.astimezone(datetime.timezone.utc).replace(tzinfo=None))
+    series, occurrences = [], []
+    for event in events:
+        found = _event_occurrences(event, window_start, window_end, tz)
+        if not found:
+            continue
+        index = len(series)
+        series.append(event)
+        for start, end in found:
+            occurrences.append([index, utc(start), utc(end) if end else None])
+    return {'series': series, 'occurrences': occurrences}
+
 if __name__ == '__main__':
     remote = input('Go Remote? (y/N): ').lower() == 'y'
     if remote:
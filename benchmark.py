@@ -0,0 +1,402 @@
+"""
+Benchmarks for the hot paths of the tracker, run through the Flask test client against
+generated fixtures.
+
+    python benchmark.py generate --rows 10000 --output fixture.db
+    python benchmark.py run --rows 1000 10000 100000 --output results.json
+    python benchmark.py compare baseline.json results.json
+    python benchmark.py check-queries
+
+A fixture holds a People collection and --collections Projects collections of --rows items
+each. Projects have a Relation to People, a NestedDatabase of Tasks (populated for the
+first NESTED_ITEMS items), row formulas over both, summary formulas (pushed down and
+Python-evaluated) and DateTime items of which a share recur. Fixtures are deterministic
+for a given seed; `run` benchmarks a scratch copy so mutating benchmarks start fresh.
+"""
+import argparse, ast, json, os, platform, random, shutil, sqlite3, statistics, subprocess, sys, tempfile, time, datetime
+import database
+
+DEFAULT_ROWS = [1000, 10000, 100000]
+NESTED_ITEMS = 50
+TASKS_PER_NESTED = 10
+STATUSES = ['Todo', 'In Progress', 'Blocked', 'Done']
+WORDS = ('launch review budget design audit vendor migration roadmap hiring onboarding '
+         'analytics security billing support research partner training release').split()
+
+# --- Fixture generator ---
+# Schemas are created through database.create_collection so they match what the app
+# builds; rows are bulk-inserted and the derived state (summary aggregates, calendar and
+# search indexes) is rebuilt once at the end, exactly like the rebuild-* commands do.
+
+def _project_fields(people_id):
+    return [
+        {'name': 'Name', 'type': 'Text'},
+        {'name': 'Status', 'type': 'Text'},
+        {'name': 'Notes', 'type': 'Text'},
+        {'name': 'Budget', 'type': 'Number'},
+        {'name': 'Due', 'type': 'DateTime'},
+        {'name': 'Owner', 'type': 'Relation', 'target_collection_id': people_id},
+        {'name': 'Tasks', 'type': 'NestedDatabase'},
+        {'name': 'Double Budget', 'type': 'Formula', 'expression': 'row.Budget * 2'},
+        {'name': 'Owner Team', 'type': 'Formula', 'expression': 'row.Owner.Team'},
+        {'name': 'Task Hours', 'type': 'Formula', 'expression': 'sum(row.Tasks.Hours) if row.Tasks else 0'},
+    ]
+
+PROJECT_SUMMARIES = [
+    {'name': 'Projects', 'expression': 'len(rows)'},
+    {'name': 'Total Budget', 'expression': 'sum(rows.Budget)'},
+    {'name': 'Done', 'expression': 'len(rows.filter(lambda r: r.Status == "Done"))'},
+]
+
+def _project_row(rng, n, people_count):
+    start = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=rng.randrange(366 * 24 * 4) * 15)
+    rule, rec_end, days = 'NONE', None, None
+    if rng.random() < 0.2:
+        rule = rng.choice(['DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY'])
+        if rule == 'WEEKLY' and rng.random() < 0.5:
+            days = ','.join(str(d) for d in sorted(rng.sample(range(7), 2)))
+        if rng.random() < 0.5:
+            rec_end = (start + datetime.timedelta(days=rng.randrange(7, 120))).date().isoformat()
+    all_day = 1 if rng.random() < 0.3 else 0
+    end = None if all_day else (start + datetime.timedelta(hours=rng.choice([1, 2, 4]))).isoformat()
+    return (
+        f"Project {n}", rng.choice(STATUSES), ' '.join(rng.choices(WORDS, k=8)),
+        round(rng.uniform(100, 50000), 2), start.isoformat(), rng.randrange(1, people_count + 1),
+        rule, rec_end, days, end, all_day,
+    )
+
+def generate_fixture(path, rows, collections=3, seed=42):
+    """Builds a fixture database at path. Returns {'people': id, 'projects': [ids]}."""
+    if os.path.exists(path):
+        os.remove(path)
+    previous = database.DB_NAME
+    database.DB_NAME = path
+    rng = random.Random(seed)
+    try:
+        database.init_db()
+        people_count = max(100, rows // 10)
+        people_id = database.create_collection('People', [
+            {'name': 'Name', 'type': 'Text'}, {'name': 'Team', 'type': 'Text'}, {'name': 'Email', 'type': 'Text'},
+        ])
+        people_table = database.get_collection_metadata(people_id)['table_name']
+        project_ids = [database.create_collection(f'Projects {i + 1}', _project_fields(people_id), PROJECT_SUMMARIES)
+                       for i in range(collections)]
+
+        conn = database.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(f'INSERT INTO {people_table} (name, team, email) VALUES (?, ?, ?)', [
+                (f'Person {i}', rng.choice(['Platform', 'Growth', 'Design', 'Ops']), f'person{i}@example.com')
+                for i in range(people_count)])
+            for c, project_id in enumerate(project_ids):
+                table = database.get_collection_metadata(project_id)['table_name']
+                conn.executemany(
+                    f'''INSERT INTO {table} (name, status, notes, budget, due, owner,
+                        recurrence_rule, recurrence_end_date, recurrence_days, end_date_time, is_all_day)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    [_project_row(rng, n, people_count) for n in range(rows)])
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Nested Tasks databases under the first items of every Projects collection
+        for project_id in project_ids:
+            table = database.get_collection_metadata(project_id)['table_name']
+            conn = database.get_db_connection()
+            try:
+                items = conn.execute(f'SELECT id, name FROM {table} ORDER BY id LIMIT ?', (NESTED_ITEMS,)).fetchall()
+            finally:
+                conn.close()
+            for item in items:
+                nested_id = database.create_collection(item['name'], [
+                    {'name': 'Task', 'type': 'Text'}, {'name': 'Hours', 'type': 'Number'},
+                ], None, project_id, str(item['id']))
+                nested_table = database.get_collection_metadata(nested_id)['table_name']
+                conn = database.get_db_connection()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.executemany(f'INSERT INTO {nested_table} (task, hours) VALUES (?, ?)', [
+                        (f"{rng.choice(WORDS)} {t}", rng.choice([0.5, 1, 2, 3, 5, 8])) for t in range(TASKS_PER_NESTED)])
+                    conn.execute(f'UPDATE {table} SET tasks = ? WHERE id = ?', (nested_id, item['id']))
+                    conn.commit()
+                finally:
+                    conn.close()
+
+        database.rebuild_summary_aggregates()
+        database.rebuild_calendar_events()
+        database.rebuild_search_index()
+        return {'people': people_id, 'projects': project_ids}
+    finally:
+        database.close_pool()
+        database.invalidate_metadata_cache()
+        database.DB_NAME = previous
+
+def _fixture_info(path):
+    conn = sqlite3.connect(path)
+    try:
+        people = conn.execute("SELECT id FROM collections WHERE name = 'People'").fetchone()[0]
+        projects = [r[0] for r in conn.execute("SELECT id FROM collections WHERE name LIKE 'Projects %' ORDER BY name")]
+    finally:
+        conn.close()
+    return {'people': people, 'projects': projects}
+
+# --- Benchmarks ---
+# Each benchmark is a callable making one request; runs after a warm-up call are timed and
+# summarised. Mutating benchmarks pick a fresh target on every call.
+
+def _timed(fn, repeat):
+    fn()  # warm-up: connection pool, metadata cache, compiled formulas
+    samples, status = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+        'status': status,
+    }
+
+def _benchmarks(client, info, nested_items):
+    projects = info['projects'][0]
+    items_url = f'/api/collections/{projects}/items'
+    counter = iter(range(10 ** 9))
+    targets = iter(nested_items)
+
+    def get(url, **params):
+        return lambda: client.get(url, query_string=params).status_code
+
+    def add_item():
+        n = next(counter)
+        return client.post(items_url, json={
+            'name': f'Benchmark item {n}', 'status': 'Todo', 'budget': 1000 + n, 'due': '2024-03-15T09:00:00',
+        }).status_code
+
+    def delete_with_nested():
+        # Deleting an item cascades to the nested Tasks database under it
+        return client.delete(f'{items_url}/{next(targets)}').status_code
+
+    calendar_window = {'start': '2024-03-01T00:00:00.000Z', 'end': '2024-04-01T00:00:00.000Z'}
+    return [
+        ('get_collections', get('/api/collections')),
+        ('get_items.full', get(items_url)),
+        ('get_items.page', get(items_url, limit=100)),
+        ('get_items.where', get(items_url, where='Status == "Blocked" and Budget > 25000', limit=100)),
+        ('get_items.order_by_formula', get(items_url, order_by='-Double Budget', where='Status == "Done"', limit=100)),
+        ('get_global_calendar', get('/api/calendar/items', **calendar_window)),
+        ('get_global_calendar.expand', get('/api/calendar/items', expand=1, tz='UTC', **calendar_window)),
+        ('search', get('/api/search', q='roadmap secur')),
+        ('add_item', add_item),
+        ('delete_item.cascade', delete_with_nested),
+    ]
+
+def run_benchmarks(fixture, repeat=5, only=None):
+    """Runs every benchmark against a scratch copy of fixture. Returns a list of result dicts."""
+    workdir = tempfile.mkdtemp(prefix='tracker-bench-')
+    scratch = os.path.join(workdir, 'tracker.db')
+    shutil.copyfile(fixture, scratch)
+    database.DB_NAME = scratch
+    database.close_pool()
+    database.invalidate_metadata_cache()
+    try:
+        import app  # Imported late: app.py runs init_db() against database.DB_NAME on import
+        database.init_db()
+        info = _fixture_info(scratch)
+        conn = database.get_db_connection()
+        try:
+            table = database.get_collection_metadata(info['projects'][0])['table_name']
+            rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            nested_items = [r[0] for r in conn.execute(f'SELECT id FROM {table} WHERE tasks IS NOT NULL ORDER BY id')]
+        finally:
+            conn.close()
+
+        results = []
+        client = app.app.test_client()
+        for name, fn in _benchmarks(client, info, nested_items):
+            if only and name not in only:
+                continue
+            if name == 'delete_item.cascade' and len(nested_items) < repeat + 1:
+                print(f"Skipping {name}: the fixture has only {len(nested_items)} items with nested databases")
+                continue
+            result = {'benchmark': name, 'rows': rows}
+            result.update(_timed(fn, repeat))
+            print(f"{name:<32} rows={rows:<8} median={result['median_ms']:>10.2f} ms  p95={result['p95_ms']:>10.2f} ms")
+            results.append(result)
+        return results
+    finally:
+        database.close_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'commit': commit,
+    }
+
+# --- Query pushdown check ---
+# ?where= terms that compile to SQL must select exactly the rows the Python evaluator would.
+# check_queries builds a small collection in which every field is unset (NULL or '') on a
+# share of the rows and compares both paths. Unset Text equalling both None and "" is a
+# documented difference, so Text is only ever NULL or a non-empty string here.
+
+QUERY_CHECKS = [
+    'Price > 2', 'not Price > 2', 'Price < 1', 'Price == 0', 'Price != 0', 'Price in [1]', 'Price not in [1]',
+    'Price in [0, 3]', 'Price not in [0]', 'Price == None', 'Price != None', 'not (Price > 2 or Tag == "a")',
+    'Tag == "a"', 'not Tag == "a"', 'Tag != "a"', 'Tag in ["a"]', 'Tag not in ["a"]', 'Tag in [None, "b"]',
+    'Tag not in [None]', 'Tag == None', 'not Tag is None', 'Tag >= "b"', 'not Tag >= "b"',
+    'Due > "2024-03-01"', 'not Due > "2024-03-01"', 'Due > "2024-03-01" or Price > 2', 'Due == None',
+    'Due != None and not Price in [1, 2]', 'Tag == "a" and (Price > 1 or Due < "2024-02-01")',
+    '1 < Price <= 3', 'not 1 < Price <= 3', 'Price > 1 and not Tag in ["a", "b"]',
+]
+
+def check_queries(rows=500, seed=7):
+    """Runs QUERY_CHECKS through the items endpoint and the Python evaluator. Returns the mismatches."""
+    workdir = tempfile.mkdtemp(prefix='tracker-check-')
+    database.DB_NAME = os.path.join(workdir, 'tracker.db')
+    database.close_pool()
+    database.invalidate_metadata_cache()
+    rng = random.Random(seed)
+    try:
+        import app  # Imported late: app.py runs init_db() against database.DB_NAME on import
+        database.init_db()
+        collection_id = database.create_collection('Checks', [
+            {'name': 'Name', 'type': 'Text'}, {'name': 'Tag', 'type': 'Text'},
+            {'name': 'Price', 'type': 'Number'}, {'name': 'Due', 'type': 'DateTime'},
+        ])
+        meta = database.get_collection_metadata(collection_id)
+        conn = database.get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(f"INSERT INTO {meta['table_name']} (name, tag, price, due) VALUES (?, ?, ?, ?)", [(
+                f'Row {n}', rng.choice([None, 'a', 'b', 'c']),
+                rng.choice([None, 0, 1, 2, 3, 4.5]),
+                rng.choice([None, '2024-01-15T09:00:00', '2024-03-01T00:00:00', '2024-06-30T18:30:00']),
+            ) for n in range(rows)])
+            conn.commit()
+            items = [dict(r) for r in conn.execute(f"SELECT * FROM {meta['table_name']}").fetchall()]
+        finally:
+            conn.close()
+
+        fields = meta['schema']['fields']
+        all_rows = app.RowList(items, fields)
+        client = app.app.test_client()
+        mismatches = []
+        for where in QUERY_CHECKS:
+            response = client.get(f'/api/collections/{collection_id}/items', query_string={'where': where, 'fields': 'id'})
+            pushed = sorted(item['id'] for item in response.get_json()['items'])
+            tree = app._QueryRowRewriter(app._build_lookup(fields)).visit(ast.parse(where, mode='eval').body)
+            code = database.compile_formula(ast.unparse(tree))
+            expected = sorted(row['id'] for row in all_rows if app._query_matches(code, row, all_rows))
+            print(f"{'ok' if pushed == expected else 'MISMATCH':<9} {len(pushed):>4} / {len(expected):>4}  {where}")
+            if pushed != expected:
+                mismatches.append((where, len(pushed), len(expected)))
+        return mismatches
+    finally:
+        database.close_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# --- Comparing runs ---
+
+def compare_results(baseline, current, threshold=0.10):
+    """Prints median changes per (benchmark, rows). Returns True if any got slower than threshold."""
+    base = {(r['benchmark'], r['rows']): r for r in baseline['results']}
+    regressed = False
+    print(f"{'benchmark':<32} {'rows':>8} {'baseline':>12} {'current':>12} {'change':>9}")
+    for r in current['results']:
+        old = base.get((r['benchmark'], r['rows']))
+        if old is None:
+            print(f"{r['benchmark']:<32} {r['rows']:>8} {'-':>12} {r['median_ms']:>10.2f}ms {'new':>9}")
+            continue
+        change = (r['median_ms'] - old['median_ms']) / old['median_ms'] if old['median_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressed, flag = True, '  REGRESSION'
+        print(f"{r['benchmark']:<32} {r['rows']:>8} {old['median_ms']:>10.2f}ms {r['median_ms']:>10.2f}ms {change:>+8.1%}{flag}")
+    return regressed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='build one fixture database')
+    gen.add_argument('--rows', type=int, default=10000, help='items per Projects collection')
+    gen.add_argument('--collections', type=int, default=3)
+    gen.add_argument('--seed', type=int, default=42)
+    gen.add_argument('--output', default='fixture.db')
+
+    run = commands.add_parser('run', help='generate fixtures and time the benchmarks')
+    run.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    run.add_argument('--collections', type=int, default=3)
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--repeat', type=int, default=5)
+    run.add_argument('--only', nargs='+', help='benchmark names to run (default: all)')
+    run.add_argument('--fixtures-dir', help='keep fixtures here and reuse existing ones')
+    run.add_argument('--output', default='benchmark-results.json')
+
+    check = commands.add_parser('check-queries', help='verify that pushed-down where filters match the Python evaluator')
+    check.add_argument('--rows', type=int, default=500)
+    check.add_argument('--seed', type=int, default=7)
+
+    cmp = commands.add_parser('compare', help='compare two result files')
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--threshold', type=float, default=0.10, help='relative median slowdown to flag')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        start = time.perf_counter()
+        generate_fixture(args.output, args.rows, args.collections, args.seed)
+        print(f"Wrote {args.output} in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    if args.command == 'check-queries':
+        return 1 if check_queries(args.rows, args.seed) else 0
+
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        return 1 if compare_results(baseline, current, args.threshold) else 0
+
+    fixtures_dir = args.fixtures_dir or tempfile.mkdtemp(prefix='tracker-fixtures-')
+    os.makedirs(fixtures_dir, exist_ok=True)
+    results = []
+    try:
+        for rows in args.rows:
+            fixture = os.path.join(fixtures_dir, f'fixture-{rows}-{args.collections}-{args.seed}.db')
+            if not os.path.exists(fixture):
+                start = time.perf_counter()
+                generate_fixture(fixture, rows, args.collections, args.seed)
+                print(f"Generated {fixture} in {time.perf_counter() - start:.1f}s")
+            results += run_benchmarks(fixture, args.repeat, args.only)
+    finally:
+        if not args.fixtures_dir:
+            shutil.rmtree(fixtures_dir, ignore_errors=True)
+
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'config': {'rows': args.rows, 'collections': args.collections, 'seed': args.seed, 'repeat': args.repeat},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,11 @@ import sqlite3
 import json
 import uuid
 import re
+import ast
+import os
+import threading
+import datetime
+import hashlib
 
 def _make_safe_name(name):
     """Converts a user-supplied field name to a valid SQLite column identifier."""
@@ -15,20 +20,439 @@ def _make_safe_name(name):
 
 DB_NAME = "tracker.db"
 
-def get_db_connection():
-    """Connects to the SQLite database and returns a connection object."""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+# --- Compiled Formula Cache ---
+# Formulas are evaluated once per row on every read, so each distinct expression is
+# parsed, validated and compiled a single time per process and the code object reused.
 
-def init_db():
+FORMULA_CACHE_MAX_SIZE = 2048
+
+_formula_cache = {}
+_formula_cache_lock = threading.Lock()
+_formula_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+def _validate_formula_ast(tree):
+    """Rejects dunder names/attributes so formulas cannot escape the restricted eval namespace."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and node.attr.startswith('__'):
+            raise ValueError(f"Access to '{node.attr}' is not allowed in formulas")
+        if isinstance(node, ast.Name) and node.id.startswith('__'):
+            raise ValueError(f"Access to '{node.id}' is not allowed in formulas")
+
+class _AggregateCallRewriter(ast.NodeTransformer):
+    """
+    Rewrites sum/min/max(X.col) into _aggregate('sum', X, 'col') and len(X) into
+    _aggregate('len', X) so the evaluator can answer them without materializing X.
+    """
+    FUNCTIONS = ('sum', 'min', 'max', 'len')
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not (isinstance(node.func, ast.Name) and node.func.id in self.FUNCTIONS):
+            return node
+        if len(node.args) != 1 or node.keywords or isinstance(node.args[0], ast.Starred):
+            return node
+        arg = node.args[0]
+        if node.func.id == 'len':
+            target, attr = arg, None
+        elif isinstance(arg, ast.Attribute):
+            target, attr = arg.value, arg.attr
+        else:
+            return node
+        call = ast.Call(
+            func=ast.Name(id='_aggregate', ctx=ast.Load()),
+            args=[ast.Constant(node.func.id), target, ast.Constant(attr)],
+            keywords=[]
+        )
+        return ast.copy_location(call, node)
+
+def _formula_references(tree):
+    """(reads_rows, names): whether the expression uses `rows`, and every attribute or string key it reads."""
+    reads_rows, names = False, set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == 'rows':
+            reads_rows = True
+        elif isinstance(node, ast.Attribute):
+            names.add(node.attr)
+        elif isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+            names.add(node.slice.value)
+    return reads_rows, frozenset(names)
+
+def _formula_entry(expression):
+    """Returns the cached (code, error, references) of an expression, parsing it on first use."""
+    with _formula_cache_lock:
+        entry = _formula_cache.get(expression)
+        if entry is not None:
+            _formula_cache_stats['hits'] += 1
+        else:
+            _formula_cache_stats['misses'] += 1
+
+    if entry is None:
+        try:
+            tree = ast.parse(expression, mode='eval')
+            _validate_formula_ast(tree)
+            references = _formula_references(tree)
+            tree = ast.fix_missing_locations(_AggregateCallRewriter().visit(tree))
+            entry = (compile(tree, '<formula>', 'eval'), None, references)
+        except (SyntaxError, ValueError) as e:
+            entry = (None, e, (False, frozenset()))
+        with _formula_cache_lock:
+            if len(_formula_cache) >= FORMULA_CACHE_MAX_SIZE:
+                # Drop the oldest entry (dicts keep insertion order)
+                _formula_cache.pop(next(iter(_formula_cache)))
+            _formula_cache[expression] = entry
+    return entry
+
+def compile_formula(expression):
+    """
+    Returns the compiled code object for a formula expression, compiling it on first use.
+    Invalid expressions raise (SyntaxError/ValueError) every time without being re-parsed.
+    Compiled formulas call _aggregate (see _AggregateCallRewriter), which the evaluator's
+    namespace must provide.
+    """
+    code, error, _ = _formula_entry(expression)
+    if error is not None:
+        raise error
+    return code
+
+def formula_reads_rows(expression):
+    """True if the expression refers to `rows` (the whole collection). Invalid expressions read nothing."""
+    return bool(expression) and _formula_entry(expression)[2][0]
+
+def formula_field_references(expression):
+    """The attribute names and string keys an expression reads (row.X, row['X'], r.X in lambdas, ...)."""
+    return _formula_entry(expression)[2][1] if expression else frozenset()
+
+def _schema_formula_expressions(schema):
+    """Collects every row and summary formula expression of a collection schema."""
+    exprs = [f.get('expression') for f in schema.get('fields', []) if f.get('type') == 'Formula']
+    exprs += [s.get('expression') for s in schema.get('summary_formulas', [])]
+    return [e for e in exprs if e]
+
+def invalidate_formula_cache(expressions=None):
+    """Evicts the given expressions from the formula cache, or everything if none are given."""
+    with _formula_cache_lock:
+        if expressions is None:
+            _formula_cache.clear()
+        else:
+            for expr in expressions:
+                _formula_cache.pop(expr, None)
+        _formula_cache_stats['invalidations'] += 1
+
+def get_formula_cache_stats():
+    """Returns hit/miss counters and the current size of the formula cache."""
+    with _formula_cache_lock:
+        stats = dict(_formula_cache_stats)
+        stats['size'] = len(_formula_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+# --- Collection Metadata Cache ---
+# Every items request needs the physical table name and parsed schema of one or more
+# collections. They are cached per process and validated against a version counter
+# stored in the database, which every schema-mutating function bumps inside its own
+# transaction, so workers sharing tracker.db drop stale entries on their next lookup.
+
+_metadata_cache = {}
+_metadata_cache_version = None
+_metadata_cache_lock = threading.Lock()
+
+def normalize_field_name(name):
+    """Loose form of a display name used to match formula references like row.UnitPrice."""
+    return re.sub(r'[^a-zA-Z0-9]', '', name or '').lower()
+
+def build_field_lookup(schema_fields):
+    """Returns (display name -> safe_name, normalized name -> safe_name, safe_name -> field) maps."""
+    d_map = {f.get('name'): f.get('safe_name') for f in schema_fields}
+    d_map_norm = {normalize_field_name(f.get('name')): f.get('safe_name') for f in schema_fields}
+    type_map = {f.get('safe_name'): f for f in schema_fields}
+    return d_map, d_map_norm, type_map
+
+def _bump_metadata_version(cursor, *collection_ids):
     """
-    Initializes the core collections table.
-    This table stores the metadata for dynamically generated 'Notion' databases.
+    Marks cached collection metadata as stale in every process, and bumps the version of
+    the collections whose schema changed (see bump_collection_version). Call inside the
+    mutating transaction.
     """
+    cursor.execute('UPDATE metadata_version SET version = version + 1 WHERE id = 1')
+    for collection_id in collection_ids:
+        bump_collection_version(cursor, collection_id)
+
+def _read_metadata_version(conn):
+    row = conn.execute('SELECT version FROM metadata_version WHERE id = 1').fetchone()
+    return row['version'] if row else None
+
+def get_collection_metadata(collection_id, conn=None):
+    """
+    Returns the cached metadata of a collection as a dict with 'table_name', 'name',
+    'schema', 'lookup' (see build_field_lookup) and 'title_field', or None if it does not exist.
+    The returned dict is shared between callers and must be treated as read-only.
+    """
+    global _metadata_cache_version
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        version = _read_metadata_version(conn)
+        with _metadata_cache_lock:
+            if version != _metadata_cache_version:
+                _metadata_cache.clear()
+                _metadata_cache_version = version
+            entry = _metadata_cache.get(collection_id)
+        if entry is not None:
+            return entry
+
+        coll = conn.execute('SELECT name, table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            return None
+        schema = json.loads(coll['schema_json'])
+        fields = schema.get('fields', [])
+        entry = {
+            'name': coll['name'],
+            'table_name': coll['table_name'],
+            'schema': schema,
+            'lookup': build_field_lookup(fields),
+            'title_field': fields[0]['safe_name'] if fields else None,
+        }
+        with _metadata_cache_lock:
+            # Only store if nobody invalidated the cache while we were reading
+            if _metadata_cache_version == version:
+                _metadata_cache[collection_id] = entry
+        return entry
+    finally:
+        if own_conn:
+            conn.close()
+
+# --- Collection Versions ---
+# collection_versions counts every change to a collection's rows or schema. Item routes
+# bump it in their write transaction and schema changes bump it via _bump_metadata_version.
+# ETags are built from these counters, so a conditional GET is answered without reading
+# any dynamic table.
+
+def bump_collection_version(cursor, collection_id):
+    cursor.execute(
+        'INSERT INTO collection_versions (collection_id, version) VALUES (?, 1) '
+        'ON CONFLICT(collection_id) DO UPDATE SET version = version + 1',
+        (collection_id,)
+    )
+
+def collections_etag():
+    """ETag of the collection list: it only changes with metadata (names, schemas, nesting)."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
+    try:
+        return f"m{_read_metadata_version(conn)}"
+    finally:
+        conn.close()
+
+def items_etag(collection_id):
+    """
+    ETag of a collection's items. Formulas can read related and nested collections, so
+    for a collection with formulas the versions of those collections (transitively) count too.
+    """
+    conn = get_db_connection()
+    try:
+        seen, frontier = set(), [collection_id]
+        while frontier:
+            seen.update(frontier)
+            nxt = set()
+            with_formulas = []
+            for cid in frontier:
+                meta = get_collection_metadata(cid, conn)
+                schema = meta['schema'] if meta else {}
+                if any(f.get('type') == 'Formula' for f in schema.get('fields', [])) or schema.get('summary_formulas'):
+                    with_formulas.append(cid)
+                    nxt.update(f['target_collection_id'] for f in schema.get('fields', []) if f.get('target_collection_id'))
+            for batch in in_batches(with_formulas):
+                nxt.update(r['id'] for r in conn.execute(
+                    f"SELECT id FROM collections WHERE parent_collection_id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall())
+            frontier = list(nxt - seen)
+
+        ids = sorted(seen)
+        versions = {}
+        for batch in in_batches(ids):
+            versions.update((r['collection_id'], r['version']) for r in conn.execute(
+                f"SELECT collection_id, version FROM collection_versions WHERE collection_id IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall())
+        key = ';'.join(f"{cid}:{versions.get(cid, 0)}" for cid in ids)
+        return hashlib.sha1(key.encode()).hexdigest()[:20]
+    finally:
+        conn.close()
+
+# --- Change Log ---
+# Every mutation appends a compact record (collection_id, item_id, op, changed_fields) to
+# change_log in its own transaction. The SSE feed polls it by seq, so writes made by any
+# process sharing the database file reach every subscriber. Only the most recent
+# CHANGE_LOG_RETENTION records are kept; a subscriber that falls further behind is told
+# to resync.
+
+CHANGE_LOG_RETENTION = 50000
+
+def record_change(cursor, collection_id, op, item_id=None, changed_fields=None):
+    record_changes(cursor, [(collection_id, item_id, op, changed_fields)])
+
+def record_changes(cursor, records):
+    """Appends (collection_id, item_id, op, changed_fields) records. Call inside the mutating transaction."""
+    if not records:
+        return
+    cursor.executemany(
+        'INSERT INTO change_log (collection_id, item_id, op, changed_fields) VALUES (?, ?, ?, ?)',
+        [(cid, item_id, op, json.dumps(fields) if fields is not None else None) for cid, item_id, op, fields in records]
+    )
+    last = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', ('change_log',)).fetchone()
+    if last and last['seq'] // 1000 != (last['seq'] - len(records)) // 1000:
+        # Crossed a thousand boundary: trim what falls outside the retention window
+        cursor.execute('DELETE FROM change_log WHERE seq <= ?', (last['seq'] - CHANGE_LOG_RETENTION,))
+
+def read_changes(after_seq, limit=500):
+    """Returns (records, oldest_seq) for changes after after_seq; oldest_seq tells a lagging reader what was pruned."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('SELECT seq, collection_id, item_id, op, changed_fields FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?', (after_seq, limit)).fetchall()
+        oldest = conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+        records = [{
+            'seq': r['seq'],
+            'collection_id': r['collection_id'],
+            'item_id': r['item_id'],
+            'op': r['op'],
+            'changed_fields': json.loads(r['changed_fields']) if r['changed_fields'] else None,
+        } for r in rows]
+        return records, oldest
+    finally:
+        conn.close()
+
+def latest_change_seq():
+    conn = get_db_connection()
+    try:
+        return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    finally:
+        conn.close()
+
+def invalidate_metadata_cache():
+    """Drops every cached collection metadata entry held by this process."""
+    global _metadata_cache_version
+    with _metadata_cache_lock:
+        _metadata_cache.clear()
+        _metadata_cache_version = None
+
+# --- Connection Pool ---
+# Connections are reused instead of opened per helper call. close() hands a connection
+# back to the pool (rolling back anything left uncommitted); only connections beyond
+# POOL_SIZE idle ones are really closed.
+
+POOL_SIZE = 8
+CONNECTION_PRAGMAS = {
+    'journal_mode': 'WAL',       # readers no longer block behind a writer
+    'synchronous': 'NORMAL',     # safe with WAL, avoids an fsync per commit
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,    # negative = KiB, i.e. 64 MiB page cache per connection
+    'busy_timeout': 5000,
+}
+
+_pool = []
+_pool_key = None
+_pool_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to the pool instead of closing it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checked_out = False
+
+    def close(self):
+        if not self._checked_out:
+            return
+        self._checked_out = False
+        _release_connection(self)
+
+    def close_for_real(self):
+        self._checked_out = False
+        super().close()
+
+def _current_pool_key():
+    # A pool is only valid for one database file in one process (connections must not cross a fork)
+    return (DB_NAME, os.getpid())
+
+def _open_connection():
+    conn = sqlite3.connect(DB_NAME, factory=PooledConnection, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
+
+def _release_connection(conn):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close_for_real()
+        return
+    with _pool_lock:
+        if _pool_key == _current_pool_key() and len(_pool) < POOL_SIZE:
+            _pool.append(conn)
+            return
+    conn.close_for_real()
+
+def configure_pool(size=None, pragmas=None):
+    """Overrides the pool size and/or connection pragmas; idle connections are reopened with the new settings."""
+    global POOL_SIZE
+    if size is not None:
+        POOL_SIZE = size
+    if pragmas:
+        CONNECTION_PRAGMAS.update(pragmas)
+    close_pool()
+
+def close_pool():
+    """Closes every idle pooled connection."""
+    global _pool_key
+    with _pool_lock:
+        idle = list(_pool)
+        _pool.clear()
+        _pool_key = None
+    for conn in idle:
+        try:
+            conn.close_for_real()
+        except sqlite3.Error:
+            pass
+
+def get_db_connection():
+    """Checks a connection out of the pool (opening one if none is idle). Call close() to return it."""
+    global _pool_key
+    key = _current_pool_key()
+    conn = None
+    stale = []
+    with _pool_lock:
+        if _pool_key != key:
+            # Connections inherited from a parent process are abandoned rather than closed
+            if _pool_key is not None and _pool_key[1] == key[1]:
+                stale = list(_pool)
+            _pool.clear()
+            _pool_key = key
+        elif _pool:
+            conn = _pool.pop()
+    for old in stale:
+        old.close_for_real()
+    if conn is None:
+        conn = _open_connection()
+    conn._checked_out = True
+    return conn
+
+# --- Schema Migrations ---
+# Schema changes are an ordered registry of migrations, each applied exactly once and
+# recorded in schema_migrations. init_db runs whatever is pending at startup; once the
+# database is current that is a single indexed read, however many collections exist.
+# `python database.py migrate` applies pending migrations ahead of a deploy and
+# `python database.py migrate --status` lists them. All pending migrations run in one
+# transaction, so a failure leaves the database at its previous version.
+
+def _table_columns(cursor, table_name):
+    return {c['name'] for c in cursor.execute(f"PRAGMA table_info({table_name})").fetchall()}
+
+def _dynamic_tables(cursor):
+    return cursor.execute('SELECT id, table_name, schema_json FROM collections').fetchall()
+
+def _migrate_core_tables(cursor):
     # Core table tracking all user-created databases
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS collections (
@@ -41,17 +465,26 @@ def init_db():
             parent_item_id TEXT
         )
     ''')
-    
-    # Run a dynamic migration on startup to ensure all existing databases have Recurrence AND Parent modifications
-    existing_tables = cursor.execute('SELECT table_name FROM collections').fetchall()
-    
-    try:
-        cursor.execute("ALTER TABLE collections ADD COLUMN parent_collection_id TEXT")
-        cursor.execute("ALTER TABLE collections ADD COLUMN parent_item_id TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    # Define columns to ensure backwards compatibility
+    # Single-row counter used to invalidate cached collection metadata across processes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metadata_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO metadata_version (id, version) VALUES (1, 0)')
+
+def _migrate_collection_nesting(cursor):
+    existing = _table_columns(cursor, 'collections')
+    for col in ('parent_collection_id', 'parent_item_id'):
+        if col not in existing:
+            cursor.execute(f"ALTER TABLE collections ADD COLUMN {col} TEXT")
+    # Nesting lookups: cascades walk parent_collection_id, item views look up parent_item_id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_collections_parent ON collections (parent_collection_id, parent_item_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_collections_parent_item ON collections (parent_item_id)')
+
+def _migrate_item_builtin_columns(cursor):
+    # Recurrence and time-span columns every dynamic table is created with nowadays
     new_cols = [
         ("recurrence_rule", "TEXT DEFAULT 'NONE'"),
         ("recurrence_end_date", "TEXT"),
@@ -59,18 +492,530 @@ def init_db():
         ("end_date_time", "TEXT"),
         ("is_all_day", "INTEGER DEFAULT 0")
     ]
-    
-    for table_row in existing_tables:
-        tname = table_row['table_name']
+    for coll in _dynamic_tables(cursor):
+        tname = coll['table_name']
+        existing = _table_columns(cursor, tname)
         for col_name, col_def in new_cols:
-            try:
+            if col_name not in existing:
                 cursor.execute(f"ALTER TABLE {tname} ADD COLUMN {col_name} {col_def}")
-            except sqlite3.OperationalError:
-                # Column likely already exists, ignore
-                pass
-            
-    conn.commit()
-    conn.close()
+
+def _migrate_summary_aggregates(cursor):
+    # Incrementally maintained summary aggregates (see read_summary_aggregates)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_aggregates (
+            collection_id TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            total REAL,
+            min_value REAL,
+            max_value REAL,
+            min_stale INTEGER NOT NULL DEFAULT 0,
+            max_stale INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (collection_id, column_name)
+        )
+    ''')
+
+def _migrate_calendar_events(cursor):
+    # Denormalized index of every dated item across collections (see sync_calendar_event)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS calendar_events (
+            collection_id TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            title TEXT,
+            start_at TEXT NOT NULL,
+            end_at TEXT,
+            is_all_day INTEGER DEFAULT 0,
+            recurrence_rule TEXT,
+            recurrence_end_date TEXT,
+            recurrence_days TEXT,
+            last_occurrence TEXT NOT NULL,
+            PRIMARY KEY (collection_id, item_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_calendar_events_window ON calendar_events (last_occurrence, start_at)')
+    for coll in _dynamic_tables(cursor):
+        tname = coll['table_name']
+        # Per-table calendar indexes are superseded by calendar_events
+        for idx in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name LIKE ?", (tname, f"idx_{tname}_cal%")).fetchall():
+            cursor.execute(f"DROP INDEX IF EXISTS {idx['name']}")
+        try:
+            reindex_calendar_events(cursor, coll['id'], tname, json.loads(coll['schema_json']))
+        except sqlite3.OperationalError as e:
+            print(f"Skipping calendar index for {tname}: {e}")
+
+def _migrate_item_indexes(cursor):
+    for coll in _dynamic_tables(cursor):
+        try:
+            _ensure_item_indexes(cursor, coll['table_name'], json.loads(coll['schema_json']))
+        except sqlite3.OperationalError as e:
+            print(f"Could not index {coll['table_name']}: {e}")
+
+def _migrate_collection_versions(cursor):
+    # Per-collection data/schema change counters (see items_etag)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS collection_versions (
+            collection_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+
+def _migrate_change_log(cursor):
+    # Append-only feed of mutations, tailed by the /api/events stream (see record_change)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            collection_id TEXT,
+            item_id INTEGER,
+            op TEXT NOT NULL,
+            changed_fields TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migrate_search_index(cursor):
+    # Full-text index over every collection's Text fields (see sync_search_documents)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_documents (
+            doc_id INTEGER PRIMARY KEY,
+            collection_id TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            UNIQUE (collection_id, item_id)
+        )
+    ''')
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    for coll in _dynamic_tables(cursor):
+        try:
+            reindex_search_documents(cursor, coll['id'], coll['table_name'], json.loads(coll['schema_json']))
+        except sqlite3.OperationalError as e:
+            print(f"Skipping search index for {coll['table_name']}: {e}")
+
+def _migrate_unmaterialize_cross_collection_formulas(cursor):
+    # Materialized formulas reading a Relation/NestedDatabase went stale when the target
+    # changed; they are computed on read again (see materialized_dependency_error)
+    for coll in _dynamic_tables(cursor):
+        schema = json.loads(coll['schema_json'])
+        fields = schema.get('fields', [])
+        stale = [f for f in materialized_fields(schema) if _materialized_crossing(fields, f)]
+        for f in stale:
+            print(f"Formula '{f.get('name')}' of {coll['table_name']} reads another collection; no longer materialized")
+            _set_materialized(cursor, coll['table_name'], f, False)
+        if stale:
+            cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), coll['id']))
+            _bump_metadata_version(cursor, coll['id'])
+
+def _migrate_summary_aggregate_non_numeric(cursor):
+    # Text stored in a Number column keeps sum/min/max summaries in Python (see read_summary_aggregates)
+    if 'non_numeric' not in _table_columns(cursor, 'summary_aggregates'):
+        cursor.execute('ALTER TABLE summary_aggregates ADD COLUMN non_numeric INTEGER NOT NULL DEFAULT 0')
+    # Existing state never counted text values; it is rebuilt on the next read
+    cursor.execute('DELETE FROM summary_aggregates')
+
+# Append only: never renumber or edit a migration that has shipped, add a new one instead.
+MIGRATIONS = [
+    (1, 'core tables', _migrate_core_tables),
+    (2, 'collection nesting columns and indexes', _migrate_collection_nesting),
+    (3, 'item recurrence columns', _migrate_item_builtin_columns),
+    (4, 'summary aggregate state', _migrate_summary_aggregates),
+    (5, 'calendar event index', _migrate_calendar_events),
+    (6, 'item title and created_at indexes', _migrate_item_indexes),
+    (7, 'collection versions', _migrate_collection_versions),
+    (8, 'change log', _migrate_change_log),
+    (9, 'full-text search index', _migrate_search_index),
+    (10, 'stop materializing cross-collection formulas', _migrate_unmaterialize_cross_collection_formulas),
+    (11, 'summary aggregate non-numeric counts', _migrate_summary_aggregate_non_numeric),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_migrations_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def get_schema_version(conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        _ensure_migrations_table(conn)
+        return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations').fetchone()[0]
+    finally:
+        if own_conn:
+            conn.close()
+
+def migrate():
+    """Applies every pending migration in one transaction. Returns the (version, name) pairs applied."""
+    conn = get_db_connection()
+    try:
+        if get_schema_version(conn) >= LATEST_SCHEMA_VERSION:
+            return []
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-read under the write lock in case another process migrated meanwhile
+            current = get_schema_version(conn)
+            applied = []
+            for version, name, migration in MIGRATIONS:
+                if version <= current:
+                    continue
+                migration(cursor)
+                cursor.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+                applied.append((version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if applied:
+            invalidate_metadata_cache()
+        return applied
+    finally:
+        conn.close()
+
+def init_db():
+    """
+    Brings the database up to the current schema (see MIGRATIONS). The core collections
+    table stores the metadata for dynamically generated 'Notion' databases.
+    """
+    for version, name in migrate():
+        print(f"Applied migration {version}: {name}")
+
+# --- Calendar Event Index ---
+# calendar_events mirrors the dated items of every collection (the first DateTime field,
+# titled by the first field) so the global calendar is one range query. Timestamps are
+# normalised to UTC in the client's toISOString() shape, so they compare as strings.
+# last_occurrence is the latest instant any occurrence of the item can still be on screen:
+# its own end for one-off items, the end of the last possible occurrence for series with a
+# recurrence_end_date, and CALENDAR_OPEN_ENDED for open series. Item writes and schema
+# changes keep it in sync inside their own transaction.
+
+CALENDAR_OPEN_ENDED = '9999-12-31T23:59:59.999Z'
+
+def calendar_date_field(schema):
+    """Returns the safe_name of the DateTime field the calendar plots, or None."""
+    for f in schema.get('fields', []):
+        if f.get('type') == 'DateTime':
+            return f.get('safe_name')
+    return None
+
+def calendar_timestamp(dt):
+    """Formats a naive UTC datetime like JavaScript's toISOString()."""
+    return dt.isoformat(timespec='milliseconds') + 'Z'
+
+def _parse_utc(value):
+    if not value:
+        return None
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _calendar_event_values(collection_id, row, title_field, date_field):
+    """Returns the calendar_events row for an item, or None if it has no usable date."""
+    start = _parse_utc(row.get(date_field))
+    if start is None:
+        return None
+    end = _parse_utc(row.get('end_date_time'))
+    duration = end - start if end and end > start else datetime.timedelta(0)
+    all_day = row.get('is_all_day') or 0
+    if all_day == 1:
+        duration = max(duration, datetime.timedelta(days=1))
+
+    rule = row.get('recurrence_rule') or 'NONE'
+    if rule == 'NONE':
+        last = calendar_timestamp(start + duration)
+    else:
+        rec_end = _parse_utc(row.get('recurrence_end_date'))
+        # The end date is a local midnight, so its last occurrence can start up to a day later
+        last = calendar_timestamp(max(rec_end, start) + datetime.timedelta(days=1) + duration) if rec_end else CALENDAR_OPEN_ENDED
+
+    return (
+        collection_id, row['id'], row.get(title_field) if title_field else row['id'],
+        calendar_timestamp(start), calendar_timestamp(end) if end else None, all_day,
+        rule, row.get('recurrence_end_date'), row.get('recurrence_days'), last
+    )
+
+def _calendar_fields(schema):
+    fields = schema.get('fields', [])
+    return (fields[0]['safe_name'] if fields else None), calendar_date_field(schema)
+
+def sync_calendar_event(cursor, collection_id, schema, item_id, new_row=None):
+    """
+    Updates the calendar index after an item write. Pass the item's new row (as a dict)
+    for inserts and updates, and only item_id for deletes. Must run in the write's transaction.
+    """
+    sync_calendar_events(cursor, collection_id, schema, [item_id], [new_row] if new_row is not None else None)
+
+def sync_calendar_events(cursor, collection_id, schema, item_ids, new_rows=None):
+    """Batch form of sync_calendar_event: drops the given items' entries, then indexes new_rows."""
+    cursor.executemany('DELETE FROM calendar_events WHERE collection_id = ? AND item_id = ?', [(collection_id, i) for i in item_ids])
+    title_field, date_field = _calendar_fields(schema)
+    if not new_rows or not date_field:
+        return
+    values = [_calendar_event_values(collection_id, row, title_field, date_field) for row in new_rows]
+    cursor.executemany('INSERT INTO calendar_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [v for v in values if v])
+
+def reindex_calendar_events(cursor, collection_id, table_name, schema):
+    """Rebuilds a collection's calendar rows, e.g. after its title or date field changed."""
+    cursor.execute('DELETE FROM calendar_events WHERE collection_id = ?', (collection_id,))
+    title_field, date_field = _calendar_fields(schema)
+    if not date_field:
+        return
+    rows = cursor.execute(f"SELECT * FROM {table_name} WHERE {date_field} IS NOT NULL AND {date_field} != ''").fetchall()
+    values = [_calendar_event_values(collection_id, dict(r), title_field, date_field) for r in rows]
+    cursor.executemany('INSERT INTO calendar_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [v for v in values if v])
+
+def rebuild_calendar_events(collection_id=None):
+    """Rebuilds the calendar index (of one collection, or all). Returns the number of collections indexed."""
+    conn = get_db_connection()
+    try:
+        if collection_id:
+            targets = conn.execute('SELECT id, table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchall()
+        else:
+            targets = conn.execute('SELECT id, table_name, schema_json FROM collections').fetchall()
+        for coll in targets:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                reindex_calendar_events(conn, coll['id'], coll['table_name'], json.loads(coll['schema_json']))
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                print(f"Skipping calendar index for {coll['table_name']}: {e}")
+        return len(targets)
+    finally:
+        conn.close()
+
+# --- Full-Text Search ---
+# search_index is an FTS5 table over the Text fields of every collection: the title (first
+# field) and the other Text fields as one body column, weighted towards the title when
+# ranking. search_documents maps each indexed item to the FTS rowid, so an item's entry is
+# replaced through its primary key instead of scanning the index. Item writes and field
+# drops keep it in sync inside their own transaction; `python database.py rebuild-search`
+# rebuilds it from the tables.
+
+SEARCH_TITLE_WEIGHT = 10.0
+
+def _search_fields(schema):
+    """Returns (title_field, [body fields]) for the Text fields a collection contributes."""
+    fields = schema.get('fields', [])
+    title_field = fields[0]['safe_name'] if fields and fields[0].get('type') != 'Formula' else None
+    body = [f['safe_name'] for f in fields if f.get('type') == 'Text' and f['safe_name'] != title_field]
+    return title_field, body
+
+def _search_values(row, title_field, body_fields):
+    title = row.get(title_field) if title_field else None
+    body = '\n'.join(str(row[f]) for f in body_fields if row.get(f))
+    if not title and not body:
+        return None
+    return ('' if title is None else str(title)), body
+
+def _delete_search_documents(cursor, where, params):
+    cursor.executemany(f'DELETE FROM search_index WHERE rowid IN (SELECT doc_id FROM search_documents WHERE {where})', params)
+    cursor.executemany(f'DELETE FROM search_documents WHERE {where}', params)
+
+def _insert_search_documents(cursor, collection_id, schema, rows):
+    title_field, body_fields = _search_fields(schema)
+    for row in rows:
+        values = _search_values(row, title_field, body_fields)
+        if values is None:
+            continue
+        doc_id = cursor.execute('INSERT INTO search_documents (collection_id, item_id) VALUES (?, ?)', (collection_id, row['id'])).lastrowid
+        cursor.execute('INSERT INTO search_index (rowid, title, body) VALUES (?, ?, ?)', (doc_id,) + values)
+
+def sync_search_documents(cursor, collection_id, schema, item_ids, new_rows=None):
+    """
+    Updates the search index after item writes: drops the entries of item_ids, then indexes
+    new_rows (dicts, for inserts and updates). Must run in the write's transaction.
+    """
+    _delete_search_documents(cursor, 'collection_id = ? AND item_id = ?', [(collection_id, i) for i in item_ids])
+    if new_rows:
+        _insert_search_documents(cursor, collection_id, schema, new_rows)
+
+def reindex_search_documents(cursor, collection_id, table_name, schema):
+    """Rebuilds a collection's search entries, e.g. after one of its Text fields was dropped."""
+    _delete_search_documents(cursor, 'collection_id = ?', [(collection_id,)])
+    rows = cursor.execute(f"SELECT * FROM {table_name}").fetchall()
+    _insert_search_documents(cursor, collection_id, schema, (dict(r) for r in rows))
+
+def rebuild_search_index(collection_id=None):
+    """Rebuilds the search index (of one collection, or all). Returns the number of collections indexed."""
+    conn = get_db_connection()
+    try:
+        if collection_id:
+            targets = conn.execute('SELECT id, table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchall()
+        else:
+            targets = conn.execute('SELECT id, table_name, schema_json FROM collections').fetchall()
+        for coll in targets:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                reindex_search_documents(conn, coll['id'], coll['table_name'], json.loads(coll['schema_json']))
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                print(f"Skipping search index for {coll['table_name']}: {e}")
+        if not collection_id:
+            # Merge the index b-trees after a full rebuild
+            conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+            conn.commit()
+        return len(targets)
+    finally:
+        conn.close()
+
+def search_match_query(text):
+    """
+    Turns free text into an FTS5 query: every word must match, the last one as a prefix
+    so results show up while typing. Returns None if the text has no searchable words.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' AND '.join(terms)
+
+def _search_snippet(text, words, width=12):
+    """A window of about `width` words around the first query word found in text."""
+    tokens = text.split()
+    lowered = [w.lower() for w in words]
+    hit = next((i for i, tok in enumerate(tokens) if any(w in tok.lower() for w in lowered)), 0)
+    start = max(0, hit - width // 3)
+    snippet = ' '.join(tokens[start:start + width])
+    return ('…' if start > 0 else '') + snippet + ('…' if start + width < len(tokens) else '')
+
+def search_items(text, limit=20, collection_id=None):
+    """
+    Returns the best matching items, best first, as dicts with collection and item ids.
+    Every match is ranked by bm25 inside the FTS query and only the top `limit` are joined
+    to their documents, so the result is exact however common the words are.
+    """
+    match = search_match_query(text)
+    if match is None:
+        return []
+    join, scope = '', ''
+    params = [match]
+    if collection_id:
+        # A join, not `rowid IN (...)`: FTS5 would rerun the match for every listed rowid
+        join = 'JOIN search_documents scoped ON scoped.doc_id = search_index.rowid'
+        scope = 'AND scoped.collection_id = ?'
+        params.append(collection_id)
+    params.append(limit)
+    conn = get_db_connection()
+    try:
+        hits = conn.execute(f"""
+            SELECT top.score, d.collection_id, c.name AS collection_name, d.item_id, s.title, s.body
+            FROM (
+                SELECT search_index.rowid AS doc_id, bm25(search_index, {SEARCH_TITLE_WEIGHT}, 1.0) AS score
+                FROM search_index {join} WHERE search_index MATCH ? {scope}
+                ORDER BY score LIMIT ?
+            ) top
+            JOIN search_index s ON s.rowid = top.doc_id
+            JOIN search_documents d ON d.doc_id = top.doc_id
+            JOIN collections c ON c.id = d.collection_id
+            ORDER BY top.score
+        """, params).fetchall()
+    finally:
+        conn.close()
+    words = re.findall(r'\w+', text)
+    return [{
+        'collection_id': h['collection_id'], 'collection_name': h['collection_name'],
+        'item_id': h['item_id'], 'title': h['title'],
+        'snippet': _search_snippet(h['body'] or h['title'], words), 'score': h['score'],
+    } for h in hits]
+
+# --- Materialized Formulas ---
+# A formula field flagged 'materialized' keeps its last computed value (JSON encoded) in a
+# shadow column. Reads use the stored value when present; any change to the collection's
+# fields clears the shadow columns so stale values are never served while a recompute runs.
+
+def _materialized_column(safe_name):
+    # Formula safe_names only have spaces replaced, so they can hold characters an identifier can't
+    return f"_mat_{_make_safe_name(safe_name)}"
+
+def materialized_fields(schema):
+    """Returns the formula fields of a schema that are stored in a shadow column."""
+    return [f for f in schema.get('fields', []) if f.get('type') == 'Formula' and f.get('materialized_column')]
+
+def _materialized_crossing(fields, field):
+    """
+    Returns the display name of the Relation or NestedDatabase field a formula reads through
+    (directly or via other formulas), or None if it only depends on its own row.
+    """
+    d_map, d_map_norm, type_map = build_field_lookup(fields)
+    pending, seen = [field], {field.get('safe_name')}
+    while pending:
+        for name in formula_field_references(pending.pop().get('expression')):
+            safe = d_map.get(name) or d_map_norm.get(normalize_field_name(name)) or (name if name in type_map else None)
+            if safe is None or safe in seen:
+                continue
+            seen.add(safe)
+            target = type_map[safe]
+            if target.get('type') in ('Relation', 'NestedDatabase'):
+                return target.get('name')
+            if target.get('type') == 'Formula':
+                pending.append(target)
+    return None
+
+def materialized_dependency_error(fields):
+    """
+    Returns an error message if a formula in fields flagged for materialization reads another
+    collection. Stored values are only refreshed when their own row is written, so those
+    formulas would go stale and have to stay computed on read.
+    """
+    for f in fields:
+        if f.get('type') == 'Formula' and (f.get('materialized') or f.get('materialized_column')):
+            via = _materialized_crossing(fields, f)
+            if via:
+                return f"Formula '{f.get('name')}' reads through '{via}' and cannot be materialized"
+    return None
+
+def _reset_materialized(cursor, table_name, schema):
+    """Clears every shadow column of a collection, forcing values to be computed on read until refreshed."""
+    columns = [f['materialized_column'] for f in materialized_fields(schema)]
+    if columns:
+        cursor.execute(f"UPDATE {table_name} SET {', '.join(f'{c} = NULL' for c in columns)}")
+
+def _set_materialized(cursor, table_name, field, enabled):
+    """Adds or drops the shadow column of a formula field and records it in the field metadata."""
+    if enabled and not field.get('materialized_column'):
+        column = base = _materialized_column(field['safe_name'])
+        existing = _table_columns(cursor, table_name)
+        n = 2
+        while column in existing: # "Total (USD)" and "Total USD" sanitize to the same name
+            column, n = f"{base}_{n}", n + 1
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column}")
+        field['materialized'] = True
+        field['materialized_column'] = column
+    elif not enabled and field.get('materialized_column'):
+        try:
+            cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN {field['materialized_column']}")
+        except Exception as e:
+            print(f"Warning: could not drop shadow column {field['materialized_column']}: {e}")
+        field.pop('materialized', None)
+        field.pop('materialized_column', None)
+
+def reset_materialized(collection_id):
+    """Clears the stored values of every materialized formula of a collection."""
+    meta = get_collection_metadata(collection_id)
+    if not meta:
+        return False
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        _reset_materialized(cursor, meta['table_name'], meta['schema'])
+        conn.commit()
+    finally:
+        conn.close()
+    return True
 
 def create_collection(name, fields, summary_formulas=None, parent_collection_id=None, parent_item_id=None):
     """
@@ -87,8 +1032,10 @@ def create_collection(name, fields, summary_formulas=None, parent_collection_id=
         field_name = _make_safe_name(field['name'])
         field_type = field['type']
         
-        # Formulas are computed dynamically on read, so no physical column
+        # Formulas are computed dynamically on read, so no physical column (unless materialized)
         if field_type == 'Formula':
+            if field.get('materialized'):
+                columns_sql.append(_materialized_column(field_name))
             continue
             
         sqlite_type = "TEXT" 
@@ -125,40 +1072,68 @@ def create_collection(name, fields, summary_formulas=None, parent_collection_id=
         ],
         'summary_formulas': summary_formulas or []
     }
+    for f, meta in zip(fields, schema_metadata['fields']):
+        if f['type'] == 'Formula' and f.get('materialized'):
+            meta['materialized'] = True
+            meta['materialized_column'] = _materialized_column(meta['safe_name'])
+    error = materialized_dependency_error(schema_metadata['fields'])
+    if error:
+        raise ValueError(error)
 
     
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 1. Create the physical SQLite table
-    cursor.execute(create_table_query)
-        
-    # 2. Register the table in our collections metadata
-    cursor.execute(
-        'INSERT INTO collections (id, name, table_name, schema_json, parent_collection_id, parent_item_id) VALUES (?, ?, ?, ?, ?, ?)',
-        (collection_id, name, table_name, json.dumps(schema_metadata), parent_collection_id, parent_item_id)
-    )
-    
-    conn.commit()
-    conn.close()
-    
+    try:
+        cursor = conn.cursor()
+
+        # 1. Create the physical SQLite table
+        cursor.execute(create_table_query)
+        _ensure_item_indexes(cursor, table_name, schema_metadata)
+
+        # 2. Register the table in our collections metadata
+        cursor.execute(
+            'INSERT INTO collections (id, name, table_name, schema_json, parent_collection_id, parent_item_id) VALUES (?, ?, ?, ?, ?, ?)',
+            (collection_id, name, table_name, json.dumps(schema_metadata), parent_collection_id, parent_item_id)
+        )
+
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'collection.create')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
     return collection_id
 
 def _enrich_with_parent_titles(conn, collections_list):
-    """Adds 'parent_item_title' to collection dictionaries if applicable."""
+    """
+    Adds 'parent_item_title' to collection dictionaries if applicable. Parent items are
+    grouped by parent collection and fetched with one IN (...) query per parent table,
+    using the cached parent metadata for the table and title field.
+    """
+    by_parent = {}
     for cdict in collections_list:
         if cdict.get('parent_collection_id') and cdict.get('parent_item_id'):
-            p_coll = conn.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (cdict['parent_collection_id'],)).fetchone()
-            if p_coll:
-                p_schema = json.loads(p_coll['schema_json'])
-                title_field = p_schema['fields'][0]['safe_name'] if p_schema.get('fields') else None
-                if title_field:
-                    try:
-                        p_item = conn.execute(f"SELECT {title_field} FROM {p_coll['table_name']} WHERE id = ?", (cdict['parent_item_id'],)).fetchone()
-                        if p_item:
-                            cdict['parent_item_title'] = p_item[title_field]
-                    except Exception:
-                        pass
+            by_parent.setdefault(cdict['parent_collection_id'], []).append(cdict)
+
+    for parent_id, children in by_parent.items():
+        p_meta = get_collection_metadata(parent_id, conn)
+        if not p_meta or not p_meta['title_field']:
+            continue
+        title_field = p_meta['title_field']
+        titles = {}
+        try:
+            for batch in in_batches({str(c['parent_item_id']) for c in children}):
+                for p_item in conn.execute(
+                    f"SELECT id, {title_field} FROM {p_meta['table_name']} WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall():
+                    titles[str(p_item['id'])] = p_item[title_field]
+        except Exception:
+            continue # e.g. the title field is a formula with no column
+        for cdict in children:
+            if str(cdict['parent_item_id']) in titles:
+                cdict['parent_item_title'] = titles[str(cdict['parent_item_id'])]
     return collections_list
 
 def get_collections():
@@ -196,105 +1171,151 @@ def get_nested_collections(parent_item_id):
 def add_formula_to_collection(collection_id, formula_data, is_summary=False):
     """Appends a new formula directly to a collection's schema metadata."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
+    try:
+        cursor = conn.cursor()
+
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            return False
+
+        schema = json.loads(coll['schema_json'])
+
+        if is_summary:
+            if 'summary_formulas' not in schema:
+                schema['summary_formulas'] = []
+            schema['summary_formulas'].append({
+                'name': formula_data['name'],
+                'expression': formula_data['expression']
+            })
+        else:
+            field = {
+                'name': formula_data['name'],
+                'safe_name': formula_data['name'].replace(' ', '_').lower(),
+                'type': 'Formula',
+                'expression': formula_data['expression']
+            }
+            error = materialized_dependency_error(schema['fields'] + [dict(field, materialized=bool(formula_data.get('materialized')))])
+            if error:
+                raise ValueError(error)
+            _reset_materialized(cursor, coll['table_name'], schema)
+            if formula_data.get('materialized'):
+                _set_materialized(cursor, coll['table_name'], field, True)
+            schema['fields'].append(field)
+
+        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'formula.add', changed_fields=[formula_data['name']])
+        conn.commit()
+        invalidate_formula_cache([formula_data['expression']])
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        return False
-        
-    schema = json.loads(coll['schema_json'])
-    
-    if is_summary:
-        if 'summary_formulas' not in schema:
-            schema['summary_formulas'] = []
-        schema['summary_formulas'].append({
-            'name': formula_data['name'],
-            'expression': formula_data['expression']
-        })
-    else:
-        schema['fields'].append({
-            'name': formula_data['name'],
-            'safe_name': formula_data['name'].replace(' ', '_').lower(),
-            'type': 'Formula',
-            'expression': formula_data['expression']
-        })
-        
-    cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
-    conn.commit()
-    conn.close()
-    return True
 
 def update_formula_in_collection(collection_id, old_name, new_data, is_summary=False):
-    """Updates a formula's name and expression dynamically."""
+    """Updates a formula's name and expression dynamically (and its 'materialized' flag if given)."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
+    try:
+        cursor = conn.cursor()
+
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            return False
+
+        schema = json.loads(coll['schema_json'])
+        old_expressions = _schema_formula_expressions(schema)
+        updated = False
+
+        if is_summary:
+            for f in schema.get('summary_formulas', []):
+                if f.get('name') == old_name:
+                    f['name'] = new_data['name']
+                    f['expression'] = new_data['expression']
+                    updated = True
+                    break
+        else:
+            for f in schema.get('fields', []):
+                if f.get('type') == 'Formula' and f.get('name') == old_name:
+                    candidate = dict(f, name=new_data['name'], safe_name=new_data['name'].replace(' ', '_').lower(), expression=new_data['expression'])
+                    if 'materialized' in new_data:
+                        candidate['materialized'] = bool(new_data['materialized'])
+                        if not new_data['materialized']:
+                            candidate.pop('materialized_column', None)
+                    error = materialized_dependency_error([candidate if x is f else x for x in schema['fields']])
+                    if error:
+                        raise ValueError(error)
+                    f['name'] = new_data['name']
+                    f['safe_name'] = new_data['name'].replace(' ', '_').lower()
+                    f['expression'] = new_data['expression']
+                    _reset_materialized(cursor, coll['table_name'], schema)
+                    if 'materialized' in new_data:
+                        _set_materialized(cursor, coll['table_name'], f, bool(new_data['materialized']))
+                    updated = True
+                    break
+
+        if updated:
+            cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+            _bump_metadata_version(cursor, collection_id)
+            record_change(cursor, collection_id, 'formula.update', changed_fields=[old_name])
+            conn.commit()
+            invalidate_formula_cache(old_expressions)
+
+        return updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        return False
-        
-    schema = json.loads(coll['schema_json'])
-    updated = False
-    
-    if is_summary:
-        for f in schema.get('summary_formulas', []):
-            if f.get('name') == old_name:
-                f['name'] = new_data['name']
-                f['expression'] = new_data['expression']
-                updated = True
-                break
-    else:
-        for f in schema.get('fields', []):
-            if f.get('type') == 'Formula' and f.get('name') == old_name:
-                f['name'] = new_data['name']
-                f['safe_name'] = new_data['name'].replace(' ', '_').lower()
-                f['expression'] = new_data['expression']
-                updated = True
-                break
-                
-    if updated:
-        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
-        conn.commit()
-        
-    conn.close()
-    return updated
 
 def delete_formula_from_collection(collection_id, formula_name, is_summary=False):
     """Deletes a formula from a collection."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
-        conn.close()
-        return False
-        
-    schema = json.loads(coll['schema_json'])
-    initial_len = 0
-    
-    if is_summary:
-        if 'summary_formulas' in schema:
-            initial_len = len(schema['summary_formulas'])
-            schema['summary_formulas'] = [f for f in schema['summary_formulas'] if f.get('name') != formula_name]
-            updated = len(schema['summary_formulas']) < initial_len
-        else:
-            updated = False
-    else:
-        if 'fields' in schema:
-            initial_len = len(schema['fields'])
-            schema['fields'] = [f for f in schema['fields'] if not (f.get('type') == 'Formula' and f.get('name') == formula_name)]
-            updated = len(schema['fields']) < initial_len
+    try:
+        cursor = conn.cursor()
+
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            return False
+
+        schema = json.loads(coll['schema_json'])
+        old_expressions = _schema_formula_expressions(schema)
+        initial_len = 0
+
+        if is_summary:
+            if 'summary_formulas' in schema:
+                initial_len = len(schema['summary_formulas'])
+                schema['summary_formulas'] = [f for f in schema['summary_formulas'] if f.get('name') != formula_name]
+                updated = len(schema['summary_formulas']) < initial_len
+            else:
+                updated = False
         else:
-            updated = False
-            
-    if updated:
-        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
-        conn.commit()
-        
-    conn.close()
-    return updated
+            if 'fields' in schema:
+                initial_len = len(schema['fields'])
+                for f in schema['fields']:
+                    if f.get('type') == 'Formula' and f.get('name') == formula_name:
+                        _set_materialized(cursor, coll['table_name'], f, False)
+                schema['fields'] = [f for f in schema['fields'] if not (f.get('type') == 'Formula' and f.get('name') == formula_name)]
+                updated = len(schema['fields']) < initial_len
+                if updated:
+                    _reset_materialized(cursor, coll['table_name'], schema)
+            else:
+                updated = False
+
+        if updated:
+            cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+            _bump_metadata_version(cursor, collection_id)
+            record_change(cursor, collection_id, 'formula.delete', changed_fields=[formula_name])
+            conn.commit()
+            invalidate_formula_cache(old_expressions)
+
+        return updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 def rename_collection(collection_id, new_name):
     """Updates the name of an existing collection."""
@@ -302,6 +1323,8 @@ def rename_collection(collection_id, new_name):
     try:
         cursor = conn.cursor()
         cursor.execute("UPDATE collections SET name = ? WHERE id = ?", (new_name, collection_id))
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'collection.rename', changed_fields=['name'])
         conn.commit()
     except Exception as e:
         print(f"Error renaming collection: {e}")
@@ -312,156 +1335,634 @@ def rename_collection(collection_id, new_name):
 
 # --- Column/Field Operations ---
 
-def add_field_to_collection(collection_id, field_data):
-    """Adds a standard physical column to an existing collection."""
+def _ensure_item_indexes(cursor, table_name, schema):
+    """
+    Indexes every dynamic table relies on: (created_at, id) for item ordering and keyset
+    pages, and a UNIQUE index on the title column (the first field) so the per-write
+    uniqueness check is a lookup. Tables that already hold duplicate titles get a plain
+    index instead until the duplicates are cleaned up. User-defined indexes recorded in
+    the schema (see create_collection_index) are created as well.
+    """
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_created ON {table_name} (created_at, id)")
+    fields = schema.get('fields', [])
+    for index in schema.get('indexes', []):
+        _create_user_index(cursor, table_name, index)
+    if not fields or fields[0].get('type') == 'Formula':
+        return
+    title_field = fields[0]['safe_name']
+    try:
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table_name}_title ON {table_name} ({title_field})")
+    except sqlite3.IntegrityError:
+        print(f"Warning: {table_name} has duplicate values in {title_field}; indexing it without UNIQUE")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_title ON {table_name} ({title_field})")
+
+def _drop_indexes_on_column(cursor, table_name, column):
+    """Drops every index that covers a column (SQLite refuses to DROP COLUMN while one exists)."""
+    for idx in cursor.execute(f"PRAGMA index_list({table_name})").fetchall():
+        if idx['origin'] != 'c':
+            continue # Implicit indexes (PRIMARY KEY / UNIQUE constraints) can't be dropped
+        cols = [c['name'] for c in cursor.execute(f"PRAGMA index_info({idx['name']})").fetchall()]
+        if column in cols:
+            cursor.execute(f"DROP INDEX IF EXISTS {idx['name']}")
+
+# --- Secondary Indexes ---
+# Users can index any stored field (or several, for a composite index) of a collection.
+# Definitions live in schema_json['indexes'] as {'name', 'fields': [safe_name, ...], 'unique'}
+# and _ensure_item_indexes recreates them, so the schema is the source of truth. SQLite keeps
+# no usage statistics, so queries that go through execute_planned count which indexes their
+# plan picked (the plan is looked up once per distinct statement); counts are per process.
+
+QUERY_PLAN_CACHE_MAX_SIZE = 512
+INDEXABLE_BUILTIN_COLUMNS = ('created_at', 'recurrence_rule', 'recurrence_end_date', 'recurrence_days', 'end_date_time', 'is_all_day')
+_query_plan_cache = {}   # sql -> tuple of index names its plan uses
+_index_usage = {}        # index name -> times a tracked query used it
+_index_usage_lock = threading.Lock()
+
+def _user_index_name(table_name, name):
+    return f"idx_{table_name}_u_{name}"
+
+def _create_user_index(cursor, table_name, index):
+    unique = 'UNIQUE ' if index.get('unique') else ''
+    cursor.execute(f"CREATE {unique}INDEX IF NOT EXISTS {_user_index_name(table_name, index['name'])} ON {table_name} ({', '.join(index['fields'])})")
+
+def execute_planned(conn, sql, params=()):
+    """Executes a read query, counting each index its query plan uses (see list_collection_indexes)."""
+    with _index_usage_lock:
+        indexes = _query_plan_cache.get(sql)
+    if indexes is None:
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        indexes = tuple(set(re.findall(r'USING (?:COVERING )?INDEX (\w+)', ' '.join(r['detail'] for r in plan))))
+        with _index_usage_lock:
+            if len(_query_plan_cache) >= QUERY_PLAN_CACHE_MAX_SIZE:
+                _query_plan_cache.pop(next(iter(_query_plan_cache)))
+            _query_plan_cache[sql] = indexes
+    if indexes:
+        with _index_usage_lock:
+            for name in indexes:
+                _index_usage[name] = _index_usage.get(name, 0) + 1
+    return conn.execute(sql, params)
+
+def _forget_query_plans():
+    # New or dropped indexes change which plan SQLite picks
+    with _index_usage_lock:
+        _query_plan_cache.clear()
+
+def create_collection_index(collection_id, field_names, unique=False, name=None):
+    """
+    Creates an index over one or more stored fields (display names or safe_names) and
+    records it in the schema. Returns the index definition, or None if the collection
+    does not exist. Raises ValueError for unknown/formula fields, a taken name, or
+    duplicate values under a UNIQUE index.
+    """
+    if not field_names:
+        raise ValueError('At least one field is required')
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            conn.rollback()
+            return None
+        table_name = coll['table_name']
+        schema = json.loads(coll['schema_json'])
+        d_map, d_map_norm, type_map = build_field_lookup(schema.get('fields', []))
+
+        columns = []
+        for field_name in field_names:
+            safe = d_map.get(field_name) or d_map_norm.get(normalize_field_name(field_name)) or field_name
+            if safe not in type_map and safe not in INDEXABLE_BUILTIN_COLUMNS:
+                raise ValueError(f"Unknown field: {field_name}")
+            if type_map.get(safe, {}).get('type') == 'Formula':
+                raise ValueError(f"Formula fields have no column to index: {field_name}")
+            if safe not in columns:
+                columns.append(safe)
+
+        index = {'name': _make_safe_name(name) if name else '_'.join(columns), 'fields': columns, 'unique': bool(unique)}
+        existing = schema.setdefault('indexes', [])
+        if any(i['name'] == index['name'] for i in existing):
+            raise ValueError(f"An index named {index['name']} already exists")
+        try:
+            _create_user_index(cursor, table_name, index)
+        except sqlite3.IntegrityError:
+            raise ValueError('Cannot create a unique index: the fields have duplicate values')
+        existing.append(index)
+        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'index.add', changed_fields=columns)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        return False
-        
-    table_name = coll['table_name']
-    schema = json.loads(coll['schema_json'])
-    
-    safe_name = _make_safe_name(field_data['name'])
-    field_type = field_data['type']
-    
-    # Check if exists
-    if any(f.get('safe_name') == safe_name for f in schema.get('fields', [])):
+    _forget_query_plans()
+    return index
+
+def drop_collection_index(collection_id, name):
+    """Drops a user-created index. Returns False if the collection or index does not exist."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        schema = json.loads(coll['schema_json']) if coll else {}
+        index = next((i for i in schema.get('indexes', []) if i['name'] == name), None)
+        if index is None:
+            conn.rollback()
+            return False
+        cursor.execute(f"DROP INDEX IF EXISTS {_user_index_name(coll['table_name'], name)}")
+        schema['indexes'].remove(index)
+        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'index.drop', changed_fields=index['fields'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        return False
-        
-    # Formulas are logical fields, they don't need a physical column
-    if field_type != 'Formula':
-        # Determine SQLite type constraint
-        sqlite_type = "TEXT"
-        if field_type == 'Number': sqlite_type = "REAL"
-        elif field_type == 'DateTime': sqlite_type = "TEXT"
-        elif field_type == 'Relation': sqlite_type = "TEXT"
-            
-        # Physical Table Alter
+    _forget_query_plans()
+    return True
+
+def list_collection_indexes(collection_id):
+    """
+    Lists every index on a collection's table, built-in ones included, with its columns,
+    size on disk (bytes, None where the dbstat table is unavailable) and the number of
+    tracked queries whose plan used it since the process started.
+    """
+    meta = get_collection_metadata(collection_id)
+    if not meta:
+        return None
+    table_name = meta['table_name']
+    user_indexes = {_user_index_name(table_name, i['name']): i for i in meta['schema'].get('indexes', [])}
+    conn = get_db_connection()
+    try:
         try:
-            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {safe_name} {sqlite_type}")
-        except Exception as e:
-            print(f"Error altering table {table_name}: {e}")
-            conn.close()
+            sizes = {r['name']: r['size'] for r in conn.execute(
+                "SELECT name, SUM(pgsize) AS size FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?) GROUP BY name",
+                (table_name,)).fetchall()}
+        except sqlite3.OperationalError:
+            sizes = None
+        listing = []
+        for idx in conn.execute(f"PRAGMA index_list({table_name})").fetchall():
+            if idx['origin'] != 'c':
+                continue
+            user = user_indexes.get(idx['name'])
+            listing.append({
+                'name': user['name'] if user else idx['name'],
+                'index_name': idx['name'],
+                'fields': [c['name'] for c in conn.execute(f"PRAGMA index_info({idx['name']})").fetchall()],
+                'unique': bool(idx['unique']),
+                'user_defined': user is not None,
+                'size_bytes': sizes.get(idx['name'], 0) if sizes is not None else None,
+                'uses': _index_usage.get(idx['name'], 0),
+            })
+    finally:
+        conn.close()
+    return listing
+
+def add_field_to_collection(collection_id, field_data):
+    """Adds a standard physical column to an existing collection."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
             return False
-        
-    # Schema Metadata Update
-    schema['fields'].append({
-        'name': field_data['name'],
-        'safe_name': safe_name,
-        'type': field_type,
-        'target_collection_id': field_data.get('target_collection_id') if field_type == 'Relation' else None,
-        'expression': field_data.get('expression', '')
-    })
-    
-    cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
-    conn.commit()
-    conn.close()
-    return True
+
+        table_name = coll['table_name']
+        schema = json.loads(coll['schema_json'])
+
+        safe_name = _make_safe_name(field_data['name'])
+        field_type = field_data['type']
+
+        # Check if exists
+        if any(f.get('safe_name') == safe_name for f in schema.get('fields', [])):
+            return False
+
+        error = materialized_dependency_error(schema.get('fields', []) + [{
+            'name': field_data['name'], 'safe_name': safe_name, 'type': field_type,
+            'expression': field_data.get('expression', ''), 'materialized': field_type == 'Formula' and bool(field_data.get('materialized')),
+        }])
+        if error:
+            raise ValueError(error)
+
+        # Formulas are logical fields, they don't need a physical column (unless materialized)
+        if field_type != 'Formula':
+            # Determine SQLite type constraint
+            sqlite_type = "TEXT"
+            if field_type == 'Number': sqlite_type = "REAL"
+            elif field_type == 'DateTime': sqlite_type = "TEXT"
+            elif field_type == 'Relation': sqlite_type = "TEXT"
+
+            # Physical Table Alter
+            try:
+                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {safe_name} {sqlite_type}")
+            except Exception as e:
+                print(f"Error altering table {table_name}: {e}")
+                conn.rollback()
+                return False
+
+        # Schema Metadata Update
+        field = {
+            'name': field_data['name'],
+            'safe_name': safe_name,
+            'type': field_type,
+            'target_collection_id': field_data.get('target_collection_id') if field_type == 'Relation' else None,
+            'expression': field_data.get('expression', '')
+        }
+        _reset_materialized(cursor, table_name, schema)
+        if field_type == 'Formula' and field_data.get('materialized'):
+            _set_materialized(cursor, table_name, field, True)
+        schema['fields'].append(field)
+        # Only a new title field or first DateTime field changes what the calendar shows
+        if _calendar_fields(schema) != _calendar_fields({'fields': schema['fields'][:-1]}):
+            reindex_calendar_events(cursor, collection_id, table_name, schema)
+        # A new Text column is empty, so the search index only changes if it became the title
+        if _search_fields(schema)[0] != _search_fields({'fields': schema['fields'][:-1]})[0]:
+            reindex_search_documents(cursor, collection_id, table_name, schema)
+
+        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'field.add', changed_fields=[safe_name])
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 def update_field_in_collection(collection_id, old_safe_name, new_name, expression=None):
     """Updates the display name or expression of a column/formula."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
+    try:
+        cursor = conn.cursor()
+
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            return False
+
+        schema = json.loads(coll['schema_json'])
+        old_expressions = _schema_formula_expressions(schema)
+        updated = False
+
+        for f in schema.get('fields', []):
+            if f.get('safe_name') == old_safe_name:
+                f['name'] = new_name
+                if f.get('type') == 'Formula' and expression is not None:
+                    f['expression'] = expression
+                    error = materialized_dependency_error(schema['fields'])
+                    if error:
+                        raise ValueError(error)
+                    _reset_materialized(cursor, coll['table_name'], schema)
+                updated = True
+                break
+
+        if updated:
+            cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+            _bump_metadata_version(cursor, collection_id)
+            record_change(cursor, collection_id, 'field.update', changed_fields=[old_safe_name])
+            conn.commit()
+            invalidate_formula_cache(old_expressions)
+
+        return updated
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        return False
-        
-    schema = json.loads(coll['schema_json'])
-    updated = False
-    
-    for f in schema.get('fields', []):
-        if f.get('safe_name') == old_safe_name:
-            f['name'] = new_name
-            if f.get('type') == 'Formula' and expression is not None:
-                f['expression'] = expression
-            updated = True
-            break
-            
-    if updated:
-        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
-        conn.commit()
-        
-    conn.close()
-    return updated
 
 def delete_field_from_collection(collection_id, safe_name):
     """Drops a physical column from the collection table (Requires SQLite 3.35.0+)"""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
-        conn.close()
-        return False
-        
-    table_name = coll['table_name']
-    schema = json.loads(coll['schema_json'])
-    
-    # 1. Update Schema
-    initial_len = len(schema.get('fields', []))
-    schema['fields'] = [f for f in schema.get('fields', []) if f.get('safe_name') != safe_name or f.get('type') == 'Formula']
-    
-    if len(schema.get('fields', [])) == initial_len:
-        conn.close()
-        return False # Was not heavily matched or is a formula
-        
-    # 2. Alter Table
     try:
-        cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN {safe_name}")
-    except Exception as e:
-        print(f"Warning: DROP COLUMN failed. It may not be supported on this SQLite version: {e}")
-        # We will continue and still remove it from the schema_json metadata layout, so it effectively disappears from UI ops.
-        
-    cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
-    conn.commit()
-    conn.close()
-    return True
+        cursor = conn.cursor()
+
+        coll = cursor.execute('SELECT table_name, schema_json FROM collections WHERE id = ?', (collection_id,)).fetchone()
+        if not coll:
+            return False
+
+        table_name = coll['table_name']
+        schema = json.loads(coll['schema_json'])
+
+        # 1. Update Schema
+        initial_len = len(schema.get('fields', []))
+        old_search_fields = _search_fields(schema)
+        schema['fields'] = [f for f in schema.get('fields', []) if f.get('safe_name') != safe_name or f.get('type') == 'Formula']
+
+        if len(schema.get('fields', [])) == initial_len:
+            return False # Was not heavily matched or is a formula
+        # Indexes covering the column go with it (_drop_indexes_on_column drops them physically)
+        if schema.get('indexes'):
+            schema['indexes'] = [i for i in schema['indexes'] if safe_name not in i['fields']]
+
+        # 2. Alter Table
+        try:
+            _drop_indexes_on_column(cursor, table_name, safe_name)
+            cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN {safe_name}")
+        except Exception as e:
+            print(f"Warning: DROP COLUMN failed. It may not be supported on this SQLite version: {e}")
+            # We will continue and still remove it from the schema_json metadata layout, so it effectively disappears from UI ops.
+
+        _reset_materialized(cursor, table_name, schema)
+        clear_summary_aggregates(cursor, collection_id, safe_name)
+        _ensure_item_indexes(cursor, table_name, schema)
+        reindex_calendar_events(cursor, collection_id, table_name, schema)
+        if _search_fields(schema) != old_search_fields:
+            reindex_search_documents(cursor, collection_id, table_name, schema)
+        cursor.execute('UPDATE collections SET schema_json = ? WHERE id = ?', (json.dumps(schema), collection_id))
+        _bump_metadata_version(cursor, collection_id)
+        record_change(cursor, collection_id, 'field.delete', changed_fields=[safe_name])
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
 def delete_collection(collection_id):
-    """Drops the table, cascades deletes to nested collections, and removes it from metadata."""
+    """
+    Drops the table, cascades deletes to nested collections, and removes it from metadata.
+    The whole subtree is resolved with one recursive query and removed in one transaction.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    coll = cursor.execute('SELECT table_name FROM collections WHERE id = ?', (collection_id,)).fetchone()
-    if not coll:
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        removed = delete_collections_in_transaction(cursor, [collection_id])
+        conn.commit()
+        return removed > 0
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
         conn.close()
-        return False
-        
-    table_name = coll['table_name']
-    conn.close() # Close before recursive call
-    
-    # Cascade delete any databases that are children of items in this collection
-    nested_db_children = get_all_nested_children_of_collection(collection_id)
-    for nested_id in nested_db_children:
-        delete_collection(nested_id)
-    
-    # Re-open connection to drop the main table and metadata
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Drop physical table
-    cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
-    # Remove metadata
-    cursor.execute('DELETE FROM collections WHERE id = ?', (collection_id,))
-    
-    conn.commit()
-    conn.close()
-    return True
 
-def get_all_nested_children_of_collection(collection_id):
-    """Helper to find all child collections recursively or directly authored by this collection."""
+# --- Nested Collection Cascades ---
+# Batched, transaction-scoped forms of the per-item cascades: the caller passes its cursor
+# (inside BEGIN IMMEDIATE) so item writes and the nested-collection changes commit together.
+
+SQL_BATCH_SIZE = 500
+
+def in_batches(values, size=SQL_BATCH_SIZE):
+    """Splits a list for IN (...) queries so they stay under SQLite's variable limit."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def nested_collection_ids(cursor, parent_collection_id, item_ids):
+    """Ids of the collections nested directly under the given items of a collection, in one query per batch."""
+    ids = []
+    for batch in in_batches([str(i) for i in item_ids]):
+        ids += [r['id'] for r in cursor.execute(
+            f"SELECT id FROM collections WHERE parent_collection_id = ? AND parent_item_id IN ({', '.join('?' * len(batch))})",
+            [parent_collection_id] + batch
+        ).fetchall()]
+    return ids
+
+def delete_collections_in_transaction(cursor, collection_ids):
+    """
+    Drops the given collections and every collection nested below them, found with one
+    recursive query. Returns the number of collections removed. Does not commit.
+    """
+    removed = {}
+    for batch in in_batches(collection_ids):
+        removed.update((r['id'], r) for r in cursor.execute(f"""
+            WITH RECURSIVE tree(id) AS (
+                SELECT id FROM collections WHERE id IN ({', '.join('?' * len(batch))})
+                UNION
+                SELECT c.id FROM collections c JOIN tree t ON c.parent_collection_id = t.id
+            )
+            SELECT c.id, c.table_name FROM collections c JOIN tree ON tree.id = c.id
+        """, batch).fetchall())
+    if not removed:
+        return 0
+    removed = list(removed.values())
+    for coll in removed:
+        cursor.execute(f"DROP TABLE IF EXISTS {coll['table_name']}")
+    ids = [(coll['id'],) for coll in removed]
+    cursor.executemany('DELETE FROM collections WHERE id = ?', ids)
+    cursor.executemany('DELETE FROM summary_aggregates WHERE collection_id = ?', ids)
+    cursor.executemany('DELETE FROM calendar_events WHERE collection_id = ?', ids)
+    _delete_search_documents(cursor, 'collection_id = ?', ids)
+    cursor.executemany('DELETE FROM collection_versions WHERE collection_id = ?', ids)
+    _bump_metadata_version(cursor)
+    record_changes(cursor, [(coll['id'], None, 'collection.delete', None) for coll in removed])
+    return len(removed)
+
+def rename_nested_collections(cursor, parent_collection_id, titles):
+    """Renames the collections nested under items to match their new titles ({item_id: title}). Does not commit."""
+    renamed = nested_collection_ids(cursor, parent_collection_id, titles.keys())
+    if not renamed:
+        return
+    cursor.executemany(
+        'UPDATE collections SET name = ? WHERE parent_collection_id = ? AND parent_item_id = ?',
+        [(title, parent_collection_id, str(item_id)) for item_id, title in titles.items()]
+    )
+    _bump_metadata_version(cursor)
+    record_changes(cursor, [(cid, None, 'collection.rename', ['name']) for cid in renamed])
+
+# --- Summary Aggregate State ---
+# summary_aggregates keeps, per collection, the row count (column_name '*') and the
+# count/sum/min/max of every Number column a summary has asked for. Item writes update
+# it in their own transaction, so summaries like sum(rows.Price) are answered without
+# scanning the table. Unset numbers count as 0, matching how formulas read them. Text
+# stored in a Number column is counted in non_numeric: formulas raise on it, so such a
+# column is left to the Python evaluator. When a delete or update removes the current
+# min/max, that bound is flagged stale. Reads never write in their own right: missing
+# state and stale bounds are computed with a read-only scan, and the result is only
+# stored if no write got in between and the database is not busy.
+
+COUNT_COLUMN = '*'
+
+def _aggregate_number(value):
+    if value is None or value == '':
+        return 0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+def _non_numeric(row, col):
+    """1 if row stores something other than a number or NULL in col (SQLite allows text in a REAL column)."""
+    if row is None:
+        return 0
+    value = row.get(col)
+    return int(value is not None and not isinstance(value, (int, float)))
+
+def clear_summary_aggregates(cursor, collection_id, column_name=None):
+    """Forgets the aggregate state of a collection (or one of its columns); it is rebuilt on the next read."""
+    if column_name is None:
+        cursor.execute('DELETE FROM summary_aggregates WHERE collection_id = ?', (collection_id,))
+    else:
+        cursor.execute('DELETE FROM summary_aggregates WHERE collection_id = ? AND column_name = ?', (collection_id, column_name))
+
+def apply_aggregate_change(cursor, collection_id, old_row=None, new_row=None):
+    """
+    Folds one item write into the aggregate state. Pass only new_row for an insert, only
+    old_row for a delete, and both for an update. Must run in the write's transaction.
+    """
+    apply_aggregate_changes(cursor, collection_id, [(old_row, new_row)])
+
+def apply_aggregate_changes(cursor, collection_id, changes):
+    """Batch form of apply_aggregate_change: changes is a list of (old_row, new_row) pairs."""
+    state = {s['column_name']: dict(s) for s in cursor.execute('SELECT * FROM summary_aggregates WHERE collection_id = ?', (collection_id,)).fetchall()}
+    dirty = set()
+    for old_row, new_row in changes:
+        delta = (1 if new_row is not None else 0) - (1 if old_row is not None else 0)
+        for col, s in state.items():
+            if col == COUNT_COLUMN:
+                if delta:
+                    s['row_count'] += delta
+                    dirty.add(col)
+                continue
+
+            old = _aggregate_number(old_row.get(col)) if old_row is not None else None
+            new = _aggregate_number(new_row.get(col)) if new_row is not None else None
+            shift = _non_numeric(new_row, col) - _non_numeric(old_row, col)
+            if delta == 0 and old == new and not shift:
+                continue
+            s['row_count'] += delta
+            s['total'] = (s['total'] or 0) - (old or 0) + (new or 0)
+            s['non_numeric'] += shift
+            dirty.add(col)
+
+            if s['row_count'] == 0:
+                s['min_value'] = s['max_value'] = None
+                s['min_stale'] = s['max_stale'] = 0
+                continue
+            if not s['min_stale']:
+                if new is not None and (s['min_value'] is None or new <= s['min_value']):
+                    s['min_value'] = new
+                elif old is not None and old == s['min_value']:
+                    s['min_stale'] = 1 # The current minimum went away; recompute lazily
+            if not s['max_stale']:
+                if new is not None and (s['max_value'] is None or new >= s['max_value']):
+                    s['max_value'] = new
+                elif old is not None and old == s['max_value']:
+                    s['max_stale'] = 1
+
+    cursor.executemany(
+        'UPDATE summary_aggregates SET row_count = ?, total = ?, min_value = ?, max_value = ?, min_stale = ?, max_stale = ?, non_numeric = ? WHERE collection_id = ? AND column_name = ?',
+        [(s['row_count'], s['total'], s['min_value'], s['max_value'], s['min_stale'], s['max_stale'], s['non_numeric'], collection_id, col) for col, s in state.items() if col in dirty]
+    )
+
+def _scan_aggregate_state(cursor, table_name, columns):
+    """Scans the table once; returns {column: state row} for the given columns plus the row count."""
+    select = ['COUNT(*)']
+    for col in columns:
+        select += [f"SUM(COALESCE({col}, 0))", f"MIN(COALESCE({col}, 0))", f"MAX(COALESCE({col}, 0))", f"SUM(typeof({col}) IN ('text', 'blob'))"]
+    res = cursor.execute(f"SELECT {', '.join(select)} FROM {table_name}").fetchone()
+    count = res[0]
+    state = {COUNT_COLUMN: {'row_count': count, 'total': None, 'min_value': None, 'max_value': None, 'non_numeric': 0}}
+    for i, col in enumerate(columns):
+        total, min_value, max_value, non_numeric = res[1 + i * 4:5 + i * 4]
+        state[col] = {'row_count': count, 'total': total or 0, 'min_value': min_value, 'max_value': max_value, 'non_numeric': non_numeric or 0}
+    return state
+
+def _store_aggregate_state(cursor, collection_id, state, version=None):
+    """Writes state rows; with a version, only while the collection is still at that version."""
+    sql = 'INSERT OR REPLACE INTO summary_aggregates (collection_id, column_name, row_count, total, min_value, max_value, min_stale, max_stale, non_numeric) SELECT ?, ?, ?, ?, ?, ?, 0, 0, ?'
+    params = [(collection_id, col, s['row_count'], s['total'], s['min_value'], s['max_value'], s['non_numeric']) for col, s in state.items()]
+    if version is not None:
+        sql += ' WHERE (SELECT COALESCE(MAX(version), 0) FROM collection_versions WHERE collection_id = ?) = ?'
+        params = [p + (collection_id, version) for p in params]
+    cursor.executemany(sql, params)
+
+def _build_aggregate_state(cursor, collection_id, table_name, columns):
+    """Scans the table once to (re)create the state rows of the given columns plus the row count."""
+    _store_aggregate_state(cursor, collection_id, _scan_aggregate_state(cursor, table_name, columns))
+
+def read_summary_aggregates(conn, collection_id, table_name, columns):
+    """
+    Returns (row_count, {column: {'sum', 'min', 'max', 'non_numeric'}}, scanned) for the given
+    Number columns. Missing state and stale min/max bounds are computed with a read-only
+    scan (scanned is then True) and stored opportunistically.
+    """
+    # One read transaction, so the version, the stored state and the scan agree
+    conn.execute('BEGIN')
+    try:
+        row = conn.execute('SELECT version FROM collection_versions WHERE collection_id = ?', (collection_id,)).fetchone()
+        version = row['version'] if row else 0
+        state = {s['column_name']: dict(s) for s in conn.execute('SELECT * FROM summary_aggregates WHERE collection_id = ?', (collection_id,)).fetchall()}
+        missing = [c for c in columns if c not in state]
+        repaired = {}
+        if missing or COUNT_COLUMN not in state:
+            repaired.update(_scan_aggregate_state(conn, table_name, missing))
+        for col in columns:
+            s = state.get(col)
+            if s is not None and (s['min_stale'] or s['max_stale']):
+                s['min_value'], s['max_value'] = conn.execute(f"SELECT MIN(COALESCE({col}, 0)), MAX(COALESCE({col}, 0)) FROM {table_name}").fetchone()
+                repaired[col] = s
+    finally:
+        conn.rollback()
+    state.update(repaired)
+
+    if repaired:
+        _try_store_aggregate_state(conn, collection_id, repaired, version)
+
+    values = {c: {'sum': state[c]['total'] or 0, 'min': state[c]['min_value'], 'max': state[c]['max_value'], 'non_numeric': state[c]['non_numeric']} for c in columns}
+    return state[COUNT_COLUMN]['row_count'], values, bool(repaired)
+
+def _try_store_aggregate_state(conn, collection_id, state, version):
+    """Stores what a read computed, unless a writer holds the lock or changed the collection since."""
+    conn.execute('PRAGMA busy_timeout = 0')
+    try:
+        _store_aggregate_state(conn, collection_id, state, version)
+        conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback() # Busy: the next read computes it again
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {CONNECTION_PRAGMAS['busy_timeout']}")
+
+def rebuild_summary_aggregates(collection_id=None):
+    """Recomputes the aggregate state (of one collection, or all) from scratch. Returns the number of collections rebuilt."""
     conn = get_db_connection()
-    # Find all collections whose parent_collection_id is this collection
-    children = conn.execute('SELECT id FROM collections WHERE parent_collection_id = ?', (collection_id,)).fetchall()
-    conn.close()
-    return [c['id'] for c in children]
+    try:
+        if collection_id:
+            targets = conn.execute('SELECT id, table_name FROM collections WHERE id = ?', (collection_id,)).fetchall()
+        else:
+            targets = conn.execute('SELECT id, table_name FROM collections').fetchall()
+        for coll in targets:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                columns = [r['column_name'] for r in conn.execute('SELECT column_name FROM summary_aggregates WHERE collection_id = ?', (coll['id'],)).fetchall() if r['column_name'] != COUNT_COLUMN]
+                clear_summary_aggregates(conn, coll['id'])
+                _build_aggregate_state(conn, coll['id'], coll['table_name'], columns)
+                conn.commit()
+            except sqlite3.OperationalError as e:
+                conn.rollback()
+                print(f"Skipping aggregates for {coll['table_name']}: {e}")
+        return len(targets)
+    finally:
+        conn.close()
 
 if __name__ == '__main__':
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        # python database.py migrate [--status]
+        if '--status' in sys.argv:
+            current = get_schema_version()
+            for version, name, _ in MIGRATIONS:
+                print(f"{'applied' if version <= current else 'pending'}  {version:>3}  {name}")
+        else:
+            init_db()
+            print(f"Schema is at version {get_schema_version()}")
+        sys.exit(0)
     init_db()
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild-aggregates':
+        # python database.py rebuild-aggregates [collection_id]
+        rebuilt = rebuild_summary_aggregates(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Rebuilt summary aggregates for {rebuilt} collection(s)")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'rebuild-calendar':
+        # python database.py rebuild-calendar [collection_id]
+        rebuilt = rebuild_calendar_events(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Rebuilt the calendar index for {rebuilt} collection(s)")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'rebuild-search':
+        # python database.py rebuild-search [collection_id]
+        rebuilt = rebuild_search_index(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"Rebuilt the search index for {rebuilt} collection(s)")
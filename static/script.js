@@ -1141,14 +1141,45 @@ document.getElementById('next-month-btn').addEventListener('click', () => {
 let globalCalendarEvents = [];
 let activeFilters = new Set();
 
-async function fetchGlobalCalendar() {
+// Only the visible range is requested. Month grids spill into the neighbouring months,
+// so pad by a week either side; the server includes any recurring series reaching in.
+function globalCalendarWindow() {
+    const start = new Date(currentCalendarDate);
+    const end = new Date(currentCalendarDate);
+    if (globalCalendarMode === 'month') {
+        start.setDate(1);
+        start.setDate(start.getDate() - 7);
+        end.setMonth(end.getMonth() + 1, 0);
+        end.setDate(end.getDate() + 7);
+    } else if (globalCalendarMode === 'week') {
+        start.setDate(start.getDate() - 7);
+        end.setDate(end.getDate() + 7);
+    }
+    start.setHours(0, 0, 0, 0);
+    end.setHours(23, 59, 59, 999);
+    return { start: start.toISOString(), end: end.toISOString() };
+}
+
+async function fetchGlobalCalendar(resetFilters = true) {
     try {
-        const res = await fetch(`${API_URL}/calendar/items`);
-        globalCalendarEvents = await res.json();
+        const { start, end } = globalCalendarWindow();
+        const tz = Intl.DateTimeFormat().resolvedOptions().timeZone || '';
+        const params = new URLSearchParams({ start, end, expand: 1, tz });
+        const res = await fetch(`${API_URL}/calendar/items?${params}`);
+        const { series, occurrences } = await res.json();
+        // Recurrences come pre-expanded: each occurrence is its series moved to a new date
+        globalCalendarEvents = occurrences.map(([i, date, endDateTime]) => ({
+            ...series[i],
+            date,
+            end_date_time: endDateTime,
+            recurrence_rule: 'NONE'
+        }));
 
         // Initialize filters - show everything by default
-        activeFilters.clear();
-        globalCalendarEvents.forEach(evt => activeFilters.add(evt.collection_id));
+        if (resetFilters) {
+            activeFilters.clear();
+            collections.forEach(coll => activeFilters.add(coll.id));
+        }
 
         renderGlobalCalendar();
         renderGlobalFilters();
@@ -1203,21 +1234,21 @@ function renderGlobalCalendar() {
 
 document.getElementById('gc-mode-select').addEventListener('change', (e) => {
     globalCalendarMode = e.target.value;
-    renderGlobalCalendar();
+    fetchGlobalCalendar(false);
 });
 
 document.getElementById('gc-prev-month-btn').addEventListener('click', () => {
     if (globalCalendarMode === 'week') currentCalendarDate.setDate(currentCalendarDate.getDate() - 7);
     else if (globalCalendarMode === 'day') currentCalendarDate.setDate(currentCalendarDate.getDate() - 1);
     else currentCalendarDate.setMonth(currentCalendarDate.getMonth() - 1);
-    renderGlobalCalendar();
+    fetchGlobalCalendar(false);
 });
 
 document.getElementById('gc-next-month-btn').addEventListener('click', () => {
     if (globalCalendarMode === 'week') currentCalendarDate.setDate(currentCalendarDate.getDate() + 7);
     else if (globalCalendarMode === 'day') currentCalendarDate.setDate(currentCalendarDate.getDate() + 1);
     else currentCalendarDate.setMonth(currentCalendarDate.getMonth() + 1);
-    renderGlobalCalendar();
+    fetchGlobalCalendar(false);
 });
 
 // --- Item Operations ---
@@ -2476,5 +2507,55 @@ if (mobileMenuBtn && mobileOverlay && sidebar) {
     });
 }
 
+// --- Live Updates ---
+// Changes made in other tabs or by other clients arrive over /api/events. Bursts are
+// coalesced into one refresh per view; refetches are cheap since unchanged data
+// comes back as a 304 (ETag).
+let pendingItemRefresh = false;
+let pendingSchemaRefresh = false;
+let liveRefreshTimer = null;
+
+function scheduleLiveRefresh() {
+    clearTimeout(liveRefreshTimer);
+    liveRefreshTimer = setTimeout(async () => {
+        const schema = pendingSchemaRefresh, items = pendingItemRefresh;
+        pendingSchemaRefresh = pendingItemRefresh = false;
+        if (currentView === 'global-calendar') {
+            if (schema) {
+                const res = await fetch(`${API_URL}/collections`);
+                collections = await res.json();
+                renderSidebar();
+            }
+            await fetchGlobalCalendar(false);
+        } else if (schema) {
+            await fetchCollections();
+        } else if (items) {
+            await fetchActiveCollectionItems();
+        }
+    }, 500);
+}
+
+function subscribeToChanges() {
+    if (!window.EventSource) return;
+    const events = new EventSource(`${API_URL}/events`);
+    events.onmessage = (e) => {
+        const change = JSON.parse(e.data);
+        if (change.op.startsWith('item.')) {
+            if (currentView === 'global-calendar' || change.collection_id === activeCollectionId) {
+                pendingItemRefresh = true;
+                scheduleLiveRefresh();
+            }
+        } else {
+            pendingSchemaRefresh = true;
+            scheduleLiveRefresh();
+        }
+    };
+    events.addEventListener('resync', () => {
+        pendingSchemaRefresh = true;
+        scheduleLiveRefresh();
+    });
+}
+
 // Start
 fetchCollections();
+subscribeToChanges();